@@ -0,0 +1,87 @@
+"""Compare the per item cost of serializing list responses through
+response_model validation + jsonable_encoder + json (FastAPI's default)
+with serializers.dumps. Runs on in-memory rows, no database is queried.
+
+    python -m benchmarks.serialization --items 1000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import models, schemas, serializers
+
+
+def make_products(items: int):
+    return [
+        models.Product(
+            id=i, name=f"benchmark product {i}", price=Decimal("100.01"), desc="x" * 100, seller_id=1,
+            imgs=[
+                models.Image(id=i * 3 + j, img=f"https://example.com/{i}/{j}.jpg", desc="", product_id=i)
+                for j in range(3)
+            ],
+        )
+        for i in range(items)
+    ]
+
+
+def make_orders(items: int):
+    return [
+        models.Order(
+            id=i, price=100, is_cod=True, is_cancled=False, is_delivered=False, status="Placed",
+            customer_id=1, seller_id=1, product_id=i, placed_at=datetime.now(timezone.utc),
+        )
+        for i in range(items)
+    ]
+
+
+def response_model_path(schema):
+    field = create_response_field(name="Response", type_=list[schema])
+
+    def serialize(rows):
+        content = asyncio.run(serialize_response(field=field, response_content=rows))
+        return JSONResponse(content).body
+    return serialize
+
+
+def plan_path(schema):
+    def serialize(rows):
+        return serializers.dumps(schema, rows)
+    return serialize
+
+
+def best_of(serialize, rows, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        serialize(rows)
+        timings.append(time.perf_counter() - start)
+    return min(timings) / len(rows) * 1_000_000
+
+
+def main(items: int, repeat: int):
+    for schema, rows in ((schemas.ProductOut, make_products(items)), (schemas.OrderOut, make_orders(items))):
+        before, after = response_model_path(schema), plan_path(schema)
+        assert json.loads(before(rows)) == json.loads(after(rows)), f"{schema.__name__} output differs"
+
+        before_us = best_of(before, rows, repeat)
+        after_us = best_of(after, rows, repeat)
+        print(
+            f"{schema.__name__:<12} response_model {before_us:8.2f} us/item"
+            f"  serializers {after_us:8.2f} us/item  ({before_us / after_us:5.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark list response serialization")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    main(args.items, args.repeat)
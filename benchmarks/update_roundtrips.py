@@ -0,0 +1,88 @@
+"""Compare the round trips and latency of crud.update_product with the
+load / check / update / reload sequence it replaced.
+
+    python -m benchmarks.update_roundtrips --updates 500
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import event, select, update
+
+import crud, models, schemas
+from database import AsyncSessionLocal, async_engine
+
+
+statements = 0
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+async def load_check_update_reload(db, product_id: int, seller_id: int, new_details: schemas.ProductIn):
+    # what PUT /products/{id}/update used to do: load the product (and its
+    # images) to check the seller owns it, then update it, bump its version,
+    # touch the seller and reload it for the response
+    product = await crud.get_product(db, product_id)
+    if product.seller_id == seller_id:
+        where = models.Product.id == product_id
+        await db.execute(
+            update(models.Product).where(where)
+                .values({**new_details.dict(), "version_id": models.Product.version_id + 1})
+                .execution_options(synchronize_session=False)
+        )
+        await db.execute(crud._touch_seller(seller_id))
+        await db.commit()
+        reload_query = select(models.Product).where(where).options(*crud.product_out_options)\
+                        .execution_options(populate_existing=True)
+        return (await db.execute(reload_query)).scalars().first()
+
+
+async def update_returning(db, product_id: int, seller_id: int, new_details: schemas.ProductIn):
+    return await crud.update_product(db, product_id, new_details, seller_id)
+
+
+async def run(name, update_fn, product_id: int, seller_id: int, updates: int):
+    global statements
+    statements = 0
+    timings = []
+    async with AsyncSessionLocal() as db:
+        for i in range(updates):
+            new_details = schemas.ProductIn(name=f"benchmark product {i}", price=1 + i % 100)
+            start = time.perf_counter()
+            await update_fn(db, product_id, seller_id, new_details)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    print(
+        f"{name:<26} {statements / updates:5.1f} statements/update"
+        f"  p50 {timings[len(timings) // 2]:7.2f} ms"
+        f"  p95 {timings[int(len(timings) * 0.95)]:7.2f} ms"
+    )
+
+
+async def main(updates: int, product_id: int | None):
+    query = select(models.Product.id, models.Product.seller_id)
+    if product_id is not None:
+        query = query.where(models.Product.id == product_id)
+    async with AsyncSessionLocal() as db:
+        product = (await db.execute(query.limit(1))).first()
+    if product is None:
+        raise SystemExit("no product to update, create one first")
+
+    await run("load/check/update/reload", load_check_update_reload, product.id, product.seller_id, updates)
+    await run("update ... returning", update_returning, product.id, product.seller_id, updates)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark round trips of product updates")
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--product-id", type=int, default=None,
+                        help="product to update, defaults to any existing one")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.updates, args.product_id))
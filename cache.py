@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded least-recently-used mapping whose entries expire at a given epoch time."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at: float):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+
+class CacheBackend:
+    """Store behind the catalog cache; a shared cache only needs to implement these."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl: float | None = None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """Per process backend, entries are evicted by ttl and least recent use."""
+
+    def __init__(self, maxsize: int):
+        self._entries = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.time() + ttl if ttl is not None else float("inf")
+        self._entries.set(key, value, expires_at=expires_at)
+
+    def delete(self, key):
+        self._entries.delete(key)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,97 @@
+import os
+
+from dotenv import load_dotenv, find_dotenv
+
+from cache import CacheBackend, MemoryBackend
+
+
+# loading environment variables from .env file
+load_dotenv(find_dotenv())
+
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", "60"))
+CATALOG_CACHE_SIZE = int(os.environ.get("CATALOG_CACHE_SIZE", "10000"))
+# seconds a catalog write may take to reach the read replicas; listing
+# pages are loaded from the primary that long after a write, so that a
+# page cached meanwhile isn't an old one
+CATALOG_REPLICA_LAG = float(os.environ.get("CATALOG_REPLICA_LAG", "5"))
+
+# bumped on every catalog write, listing keys embed it so that stale pages
+# are never looked up again (and age out of the backend on their own)
+GENERATION_KEY = "catalog:generation"
+# present for CATALOG_REPLICA_LAG seconds after every catalog write
+RECENT_WRITE_KEY = "catalog:recent-write"
+
+
+backend: CacheBackend = MemoryBackend(maxsize=CATALOG_CACHE_SIZE)
+hits = 0
+misses = 0
+
+
+def use_backend(new_backend: CacheBackend):
+    global backend
+    backend = new_backend
+
+
+def product_key(product_id: int):
+    return f"product:{product_id}"
+
+
+def written_version_key(product_id: int):
+    return f"product:{product_id}:written"
+
+
+def listing_key(*parts):
+    generation = backend.get(GENERATION_KEY) or 0
+    return "listing:" + ":".join(str(part) for part in (generation, *parts))
+
+
+def get(key):
+    global hits, misses
+    value = backend.get(key)
+    if value is None:
+        misses += 1
+    else:
+        hits += 1
+    return value
+
+
+def set(key, value):
+    backend.set(key, value, ttl=CATALOG_CACHE_TTL)
+
+
+def set_product(key, product_id: int, version_id: int, value):
+    # a load that read the product as it was before its last write (from a
+    # lagging replica, or one in flight when the write committed) would
+    # cache the old body and ETag, it is served but not cached
+    written = backend.get(written_version_key(product_id))
+    if written is None or version_id >= written:
+        set(key, value)
+
+
+def invalidate_listings():
+    # flagged before the bump, a load under the new generation sees the flag
+    backend.set(RECENT_WRITE_KEY, True, ttl=CATALOG_REPLICA_LAG)
+    backend.set(GENERATION_KEY, (backend.get(GENERATION_KEY) or 0) + 1)
+
+
+def recently_written():
+    # whether the replicas may not have the last catalog write yet
+    return backend.get(RECENT_WRITE_KEY) is not None
+
+
+def invalidate_product(product_id: int, version_id: int):
+    # version_id is the version the write left the product at; it is kept
+    # as long as an entry loaded before the write could be set
+    backend.set(written_version_key(product_id), version_id, ttl=CATALOG_CACHE_TTL)
+    backend.delete(product_key(product_id))
+    invalidate_listings()
+
+
+def stats():
+    lookups = hits + misses
+    return {
+        "backend": type(backend).__name__,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+    }
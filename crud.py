@@ -1,115 +1,395 @@
+from datetime import datetime
+import os
+
 from pydantic import HttpUrl, EmailStr
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, exc, func, insert, literal, literal_column, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
 
+import catalog_cache
+from database import checkout_connection
 import models, schemas
 from security import get_password_hash
+from hashing import run_in_hash_pool
+
+
+# rows per multi-row INSERT of a bulk create, keeps the bind parameters
+# of a statement well below the 32767 asyncpg allows
+BULK_INSERT_BATCH_SIZE = int(os.environ.get("BULK_INSERT_BATCH_SIZE", "1000"))
+
+# loading strategy for the response schemas, so that serializing a page of
+# schemas.ProductOut costs a fixed number of queries instead of one lazy
+# load per product; sellers never load their products, see main.seller_out
+product_out_options = (selectinload(models.Product.imgs),)
+
+# relationships of the response schemas, by field name
+relationship_options = {
+    models.Product: {"imgs": product_out_options[0]},
+}
+
+
+def load_options(model, fields: frozenset[str] | None, *always: str):
+    # what a response limited to fields (see fieldsets) needs: their columns
+    # (and always, which the endpoint itself uses) and the relationships
+    # among them, nothing else is loaded; everything when fields is None
+    relationships = relationship_options.get(model, {})
+    if fields is None:
+        return tuple(relationships.values())
+
+    # the primary key is loaded anyway, naming it keeps load_only non-empty
+    # when only relationships are asked for
+    columns = [getattr(model, name) for name in sorted(fields.union(always, ["id"])) if name not in relationships]
+    return (load_only(*columns), *(option for name, option in relationships.items() if name in fields))
+
+# version_id (the source of the ETags of catalog reads) is only bumped by
+# the ORM when it flushes changes to an object; UPDATE statements, and
+# changes to what a parent serializes (a product's images, a seller's
+# products), have to bump it themselves
+def _bump_version(model, where):
+    return update(model).where(where)\
+            .values({model.version_id: model.version_id + 1})\
+            .execution_options(synchronize_session=False)
+
+
+def _touch_product(product_id):
+    return _bump_version(models.Product, models.Product.id == product_id)
+
+
+def _touch_seller(seller_id):
+    return _bump_version(models.Seller, models.Seller.id == seller_id)
+
+
+def _touch_seller_of_product(product_id):
+    return _touch_seller(
+        select(models.Product.seller_id).where(models.Product.id == product_id).scalar_subquery()
+    )
+
+
+def _touch_product_of_image(image_id):
+    product_id = select(models.Image.product_id).where(models.Image.id == image_id).scalar_subquery()
+    return _touch_product(product_id), _touch_seller_of_product(product_id)
+
+
+async def _invalidate_product(db: AsyncSession, product_id):
+    # read once the write committed, from the primary: the version a cached
+    # product has to be at least of from now on
+    catalog_cache.invalidate_product(product_id, await get_version_id(db, models.Product, product_id))
+
+
+async def _hash_password(db: AsyncSession, password: str):
+    # the session's connection goes back to the pool while bcrypt runs and
+    # is checked out again (503 when the pool is busy) once it's done
+    await db.close()
+    hashed_password = await run_in_hash_pool(get_password_hash, password)
+    await checkout_connection(db)
+    return hashed_password
+
 
 ## Create ##
 
-def create_bank_account(db: Session, account: schemas.AccountIn, seller_id):
+async def create_bank_account(db: AsyncSession, account: schemas.AccountIn, seller_id):
     new_account = models.Account(
         **account.dict(), seller_id=seller_id
     )
 
     db.add(new_account)
-    db.commit()
-    db.refresh(new_account)
+    await db.commit()
+    await db.refresh(new_account)
     return new_account
 
 
-def create_card(db: Session, card: schemas.CardIn, customer_id: int):
+async def create_card(db: AsyncSession, card: schemas.CardIn, customer_id: int):
     new_card = models.Card(
         **card.dict(), customer_id=customer_id
     )
 
     db.add(new_card)
-    db.commit()
-    db.refresh(new_card)
+    await db.commit()
+    await db.refresh(new_card)
     return new_card
 
 
-def creater_customer(db: Session, customer: schemas.CustomerIn, password: str):
+async def creater_customer(db: AsyncSession, customer: schemas.CustomerIn, password: str):
     new_customer = models.Customer(
         **customer.dict(),
-        hashed_password=get_password_hash(password=password)
+        hashed_password=await _hash_password(db, password)
     )
 
     db.add(new_customer)
-    db.commit()
-    db.refresh(new_customer)
+    await db.commit()
+    await db.refresh(new_customer)
     return new_customer
 
 
-def create_image(db: Session, new_image: schemas.ImageIn):
+async def create_image(db: AsyncSession, new_image: schemas.ImageIn):
     new_image = models.Image(**new_image.dict())
 
     db.add(new_image)
-    db.commit()
-    db.refresh(new_image)
+    await db.execute(_touch_product(new_image.product_id))
+    await db.execute(_touch_seller_of_product(new_image.product_id))
+    await db.commit()
+    await db.refresh(new_image)
+    await _invalidate_product(db, new_image.product_id)
     return new_image
 
 
-def create_order(db: Session, order: schemas.OrderIn):
+async def create_order(db: AsyncSession, order: schemas.OrderIn):
     new_order = models.Order(**order.dict())
 
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    await db.commit()
+    await db.refresh(new_order)
     return new_order
 
 
-def create_product(db: Session, product: schemas.ProductIn, seller_id: int):
+# dialects whose INSERT supports ON CONFLICT DO NOTHING
+upsert_inserts = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+async def place_order(db: AsyncSession, order: schemas.OrderIn, idempotency_key: str | None = None):
+    # checking the product and inserting the order is a single
+    # INSERT ... SELECT FROM products, which inserts nothing when the product
+    # doesn't exist or isn't sold by order.seller_id, or when a retry's
+    # idempotency key is already taken; returns None in the first two cases
+    table = models.Order.__table__
+    values = {**order.dict(), "idempotency_key": idempotency_key}
+    literals = {column: literal(value, table.c[column].type) for column, value in values.items()}
+    source = select(*literals.values())\
+                .where(models.Product.id == order.product_id,
+                       models.Product.seller_id == order.seller_id)
+    query = upsert_inserts[db.bind.dialect.name](models.Order)\
+                .from_select(list(values), source)\
+                .on_conflict_do_nothing(
+                    index_elements=["customer_id", "idempotency_key"],
+                    index_where=models.Order.idempotency_key.isnot(None),
+                )
+
+    if db.bind.dialect.full_returning:
+        query = select(models.Order).from_statement(query.returning(models.Order))
+        placed = (await db.execute(query)).scalars().first()
+    else:
+        result = await db.execute(query)
+        placed = await db.get(models.Order, result.lastrowid) if result.rowcount else None
+    await db.commit()
+
+    if placed is None and idempotency_key is not None:
+        # the order placed with the key, and whether it is the one asked for
+        # now; the values are compared as the INSERT would have stored them
+        same_order = and_(*(
+            table.c[column].is_not_distinct_from(literals[column]) for column in order.__fields__
+        ))
+        query = select(models.Order, same_order.label("same_order")).where(
+            models.Order.customer_id == order.customer_id,
+            models.Order.idempotency_key == idempotency_key,
+        )
+        row = (await db.execute(query)).first()
+        if row is None:
+            return None
+        if not row.same_order:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different order"
+            )
+        return row.Order
+    return placed
+
+
+async def create_product(db: AsyncSession, product: schemas.ProductIn, seller_id: int):
+    # imgs is initialised (and the object not refreshed) so that serializing
+    # schemas.ProductOut doesn't need a lazy load, which AsyncSession forbids
     new_product = models.Product(
-        **product.dict(), seller_id=seller_id
+        **product.dict(), seller_id=seller_id, imgs=[]
     )
 
     db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
+    await db.execute(_touch_seller(seller_id))
+    await db.commit()
+    catalog_cache.invalidate_listings()
     return new_product
 
 
-def creater_seller(db: Session, seller: schemas.SellerIn, password: str):
+async def _reserve_ids(db: AsyncSession, model, count: int):
+    # count ids taken from the table's sequence in one statement, for rows
+    # inserted with explicit ids
+    sequence = func.pg_get_serial_sequence(model.__tablename__, "id")
+    query = select(func.nextval(sequence)).select_from(func.generate_series(1, count))
+    return (await db.execute(query)).scalars().all()
+
+
+async def _insert_rows(db: AsyncSession, model, rows: list[dict]):
+    # inserts rows and returns them along with their ids, in order; postgres
+    # gets one multi-row INSERT with ids reserved up front (the order of
+    # RETURNING rows isn't guaranteed to be the order of the VALUES list,
+    # so it can't pair ids with rows), backends without sequences (sqlite
+    # during development) fall back to the ORM, which inserts the rows one
+    # at a time and reads back each id
+    if db.bind.dialect.name == "postgresql":
+        ids = await _reserve_ids(db, model, len(rows))
+        rows = [{**row, "id": id} for row, id in zip(rows, ids)]
+        await db.execute(insert(model).values(rows))
+        return rows
+
+    objects = [model(**row) for row in rows]
+    db.add_all(objects)
+    await db.flush()
+    return [{**row, "id": object.id} for row, object in zip(rows, objects)]
+
+
+async def create_products_bulk(db: AsyncSession, products: list[schemas.ProductBulkIn], seller_id: int):
+    # one INSERT per batch of products (and of their images), all in a
+    # single transaction, see _insert_rows
+    if not products:
+        return []
+
+    created = []
+    for start in range(0, len(products), BULK_INSERT_BATCH_SIZE):
+        batch = products[start:start + BULK_INSERT_BATCH_SIZE]
+        rows = await _insert_rows(db, models.Product, [
+            {**product.dict(exclude={"imgs"}), "seller_id": seller_id} for product in batch
+        ])
+
+        images = [
+            {**image.dict(), "product_id": row["id"]}
+            for product, row in zip(batch, rows)
+            for image in product.imgs
+        ]
+        imgs_by_product = {}
+        if images:
+            for image in await _insert_rows(db, models.Image, images):
+                imgs_by_product.setdefault(image["product_id"], []).append(image)
+
+        created.extend({**row, "imgs": imgs_by_product.get(row["id"], [])} for row in rows)
+
+    await db.execute(_touch_seller(seller_id))
+    await db.commit()
+    catalog_cache.invalidate_listings()
+    return created
+
+
+async def creater_seller(db: AsyncSession, seller: schemas.SellerIn, password: str):
+    # see create_product for why products is initialised
     new_seller = models.Seller(
         **seller.dict(),
-        hashed_password=get_password_hash(password=password)
+        hashed_password=await _hash_password(db, password),
+        products=[]
     )
 
     db.add(new_seller)
-    db.commit()
-    db.refresh(new_seller)
+    await db.commit()
     return new_seller
 
 
 
 ## Retrieve ##
 
-def get_bank_accounts(db: Session, seller_id: int):
-    return db.query(models.Account).filter(models.Account.seller_id == seller_id).all()
+async def get_bank_accounts(db: AsyncSession, seller_id: int):
+    query = select(models.Account).where(models.Account.seller_id == seller_id)
+    return (await db.execute(query)).scalars().all()
 
 
-def get_cards(db: Session, customer_id: int):
-    return db.query(models.Card).filter(models.Card.customer_id == customer_id).all()
+async def get_cards(db: AsyncSession, customer_id: int):
+    query = select(models.Card).where(models.Card.customer_id == customer_id)
+    return (await db.execute(query)).scalars().all()
 
-def get_customer(db: Session, customer_id: int):
-    return db.query(models.Customer).filter(models.Customer.id == customer_id).first()
+async def get_customer(db: AsyncSession, customer_id: int):
+    query = select(models.Customer).where(models.Customer.id == customer_id)
+    return (await db.execute(query)).scalars().first()
 
 
-def get_customer_by_email(db: Session, email: EmailStr):
-    return db.query(models.Customer).filter(models.Customer.email == email).first()
+async def get_customer_by_email(db: AsyncSession, email: EmailStr):
+    query = select(models.Customer).where(models.Customer.email == email)
+    return (await db.execute(query)).scalars().first()
 
 
-def get_image(db: Session, image_id: int):
-    return db.query(models.Image).filter(models.Image.id == image_id).first()
+async def get_existing_image_urls(db: AsyncSession, urls: list[str]):
+    existing = set()
+    for start in range(0, len(urls), BULK_INSERT_BATCH_SIZE):
+        query = select(models.Image.img).where(
+            models.Image.img.in_(urls[start:start + BULK_INSERT_BATCH_SIZE])
+        )
+        existing.update((await db.execute(query)).scalars().all())
+    return existing
+
+
+async def get_image(db: AsyncSession, image_id: int):
+    query = select(models.Image).where(models.Image.id == image_id)
+    return (await db.execute(query)).scalars().first()
+
+
+async def get_order(db: AsyncSession, order_id: int, fields: frozenset[str] | None = None):
+    query = select(models.Order).options(*load_options(models.Order, fields))\
+                .where(models.Order.id == order_id)
+    return (await db.execute(query)).scalars().first()
+
+
+async def get_orders_by_customer(db: AsyncSession, customer_id: int, fields: frozenset[str] | None = None):
+    query = select(models.Order).options(*load_options(models.Order, fields))\
+                .where(models.Order.customer_id == customer_id)
+    return (await db.execute(query)).scalars().all()
+
+
+async def get_orders_by_seller(db: AsyncSession, seller_id: int, fields: frozenset[str] | None = None):
+    query = select(models.Order).options(*load_options(models.Order, fields))\
+                .where(models.Order.seller_id == seller_id)
+    return (await db.execute(query)).scalars().all()
+
+
+async def stream_orders_by_seller(db: AsyncSession, seller_id: int, batch_size: int):
+    # plain rows over a server side cursor, so memory stays flat however
+    # many orders the seller has
+    columns = [getattr(models.Order, name) for name in schemas.OrderOut.__fields__]
+    query = select(*columns)\
+                .where(models.Order.seller_id == seller_id)\
+                .order_by(models.Order.placed_at, models.Order.id)\
+                .execution_options(yield_per=batch_size)
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        yield rows
+
+
+async def _get_orders_placed_between(
+    db: AsyncSession, owner_column, owner_id: int, start: datetime, end: datetime,
+    limit: int, after: tuple[datetime, int] | None = None, fields: frozenset[str] | None = None
+):
+    # served by the (owner, placed_at) indexes, ordered for keyset pagination
+    query = select(models.Order)\
+                .options(*load_options(models.Order, fields, "placed_at"))\
+                .where(owner_column == owner_id)\
+                .where(models.Order.placed_at >= start, models.Order.placed_at < end)\
+                .order_by(models.Order.placed_at, models.Order.id)
+    if after is not None:
+        keyset = tuple_(models.Order.placed_at, models.Order.id)
+        query = query.where(keyset > tuple_(*after, types=(models.Order.placed_at.type, models.Order.id.type)))
+    return (await db.execute(query.limit(limit))).scalars().all()
+
+
+async def get_orders_by_customer_between(
+    db: AsyncSession, customer_id: int, start: datetime, end: datetime,
+    limit: int, after: tuple[datetime, int] | None = None, fields: frozenset[str] | None = None
+):
+    return await _get_orders_placed_between(
+        db, models.Order.customer_id, customer_id, start, end, limit, after, fields
+    )
 
 
-def get_order(db: Session, order_id: int):
-    return db.query(models.Order).filter(models.Order.id == order_id).first()
+async def get_orders_by_seller_between(
+    db: AsyncSession, seller_id: int, start: datetime, end: datetime,
+    limit: int, after: tuple[datetime, int] | None = None, fields: frozenset[str] | None = None
+):
+    return await _get_orders_placed_between(
+        db, models.Order.seller_id, seller_id, start, end, limit, after, fields
+    )
 
 
-def get_product(db: Session, product_id: int):
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+async def get_product(db: AsyncSession, product_id: int, fields: frozenset[str] | None = None):
+    query = select(models.Product).options(*load_options(models.Product, fields, "version_id"))\
+                .where(models.Product.id == product_id)
+    product = (await db.execute(query)).scalars().first()
     if (product):
         return product
     else:
@@ -119,30 +399,178 @@ def get_product(db: Session, product_id: int):
         )
 
 
-def get_seller(db: Session, seller_id: int):
-    return db.query(models.Seller).filter(models.Seller.id == seller_id).first()
+async def get_products_by_ids(db: AsyncSession, product_ids: list[int], fields: frozenset[str] | None = None):
+    query = select(models.Product).options(*load_options(models.Product, fields))\
+                .where(models.Product.id.in_(product_ids))
+    return {product.id: product for product in (await db.execute(query)).scalars().all()}
+
+
+async def get_products(
+    db: AsyncSession, limit: int, offset: int = 0, after_id: int | None = None,
+    fields: frozenset[str] | None = None
+):
+    query = select(models.Product).options(*load_options(models.Product, fields))\
+                .order_by(models.Product.id)
+    if after_id is not None:
+        query = query.where(models.Product.id > after_id)
+    else:
+        query = query.offset(offset)
+    return (await db.execute(query.limit(limit))).scalars().all()
+
+
+async def get_products_by_seller(
+    db: AsyncSession, seller_id: int, limit: int, offset: int = 0, after_id: int | None = None,
+    fields: frozenset[str] | None = None
+):
+    query = select(models.Product).options(*load_options(models.Product, fields))\
+                .where(models.Product.seller_id == seller_id)\
+                .order_by(models.Product.id)
+    if after_id is not None:
+        query = query.where(models.Product.id > after_id)
+    else:
+        query = query.offset(offset)
+    return (await db.execute(query.limit(limit))).scalars().all()
+
+
+def _ranked_page(query, rank, limit: int, after: tuple[float, int] | None, fields: frozenset[str] | None):
+    # keyset over (rank DESC, id): continue below the last rank seen, or at
+    # the same rank past the last id seen
+    if after is not None:
+        after_rank, after_id = after
+        query = query.where(or_(
+            rank < after_rank,
+            and_(rank == after_rank, models.Product.id > after_id),
+        ))
+    return query.options(*load_options(models.Product, fields))\
+                .order_by(rank.desc(), models.Product.id)\
+                .limit(limit)
+
+
+async def search_products(
+    db: AsyncSession, terms: str, limit: int, after: tuple[float, int] | None = None,
+    fields: frozenset[str] | None = None
+):
+    search_vector = models.product_search_vector
+    search_query = func.websearch_to_tsquery(
+        literal_column(f"'{models.SEARCH_CONFIG}'::regconfig"), terms
+    )
+    rank = func.ts_rank_cd(search_vector, search_query)
+    query = select(models.Product, rank).where(search_vector.op("@@")(search_query))
+    return (await db.execute(_ranked_page(query, rank, limit, after, fields))).all()
+
+
+async def search_products_similar(
+    db: AsyncSession, terms: str, limit: int, after: tuple[float, int] | None = None,
+    fields: frozenset[str] | None = None
+):
+    # pg_trgm similarity of the name, catches misspelt terms which full text
+    # search can't match; `%` keeps only names above pg_trgm.similarity_threshold
+    rank = func.similarity(models.Product.name, terms)
+    query = select(models.Product, rank).where(models.Product.name.op("%")(terms))
+    return (await db.execute(_ranked_page(query, rank, limit, after, fields))).all()
+
+
+async def get_seller(db: AsyncSession, seller_id: int, fields: frozenset[str] | None = None):
+    query = select(models.Seller).options(*load_options(models.Seller, fields, "version_id"))\
+                .where(models.Seller.id == seller_id)
+    return (await db.execute(query)).scalars().first()
+
+
+async def get_seller_by_email(db: AsyncSession, email: EmailStr, fields: frozenset[str] | None = None):
+    query = select(models.Seller).options(*load_options(models.Seller, fields))\
+                .where(models.Seller.email == email)
+    return (await db.execute(query)).scalars().first()
+
+
+async def get_sellers_by_ids(db: AsyncSession, seller_ids: list[int], fields: frozenset[str] | None = None):
+    query = select(models.Seller).options(*load_options(models.Seller, fields))\
+                .where(models.Seller.id.in_(seller_ids))
+    return {seller.id: seller for seller in (await db.execute(query)).scalars().all()}
+
+
+async def count_products_of_sellers(db: AsyncSession, seller_ids: list[int]):
+    # answered from ix_products_seller_id_id, the products aren't loaded;
+    # sellers without products are missing from the result
+    query = select(models.Product.seller_id, func.count())\
+                .where(models.Product.seller_id.in_(seller_ids))\
+                .group_by(models.Product.seller_id)
+    return dict((await db.execute(query)).all())
+
 
+async def get_first_products_of_sellers(db: AsyncSession, seller_ids: list[int], limit: int):
+    # first page (by id) of each seller's products in one statement
+    if len(seller_ids) == 1:
+        # a plain LIMIT stops after the page, the window below numbers
+        # every product of the sellers
+        products = await get_products_by_seller(db, seller_ids[0], limit)
+        return {seller_ids[0]: products}
+
+    position = func.row_number().over(
+        partition_by=models.Product.seller_id, order_by=models.Product.id
+    ).label("position")
+    ranked = select(models.Product.id, position)\
+                .where(models.Product.seller_id.in_(seller_ids))\
+                .subquery()
+    query = select(models.Product).options(*product_out_options)\
+                .join(ranked, ranked.c.id == models.Product.id)\
+                .where(ranked.c.position <= limit)\
+                .order_by(models.Product.seller_id, models.Product.id)
+
+    pages = {}
+    for product in (await db.execute(query)).scalars().all():
+        pages.setdefault(product.seller_id, []).append(product)
+    return pages
+
+
+async def get_version_id(db: AsyncSession, model, id: int):
+    # enough to answer a conditional GET without loading the row
+    query = select(model.version_id).where(model.id == id)
+    return (await db.execute(query)).scalar()
 
-def get_seller_by_email(db: Session, email: EmailStr):
-    return db.query(models.Seller).filter(models.Seller.email == email).first()
 
 
 ## Update ##
 
-def update_customer_email(db: Session, customer_id: int, new_email: str):
-    update_query = db.query(models.Customer).filter(models.Customer.id == customer_id)
-    if (update_query.first()):
-        update_query.update({"email": new_email}, synchronize_session=False)
-        db.commit()
-        return update_query.first()
+async def _update_returning(db: AsyncSession, model, where, values: dict, *options, touches=()):
+    # a single UPDATE ... RETURNING both applies the change and loads the row,
+    # an empty result means nothing matched; backends without RETURNING
+    # (sqlite during development) fall back to UPDATE followed by a SELECT.
+    # touches are run in the same transaction, see _bump_version
+    version_id = model.__mapper__.version_id_col
+    if version_id is not None:
+        values = {**values, version_id.key: version_id + 1}
+
+    update_query = update(model).where(where).values(values)\
+                    .execution_options(synchronize_session=False)
+    if db.bind.dialect.full_returning:
+        query = select(model).from_statement(update_query.returning(model))
+    elif (await db.execute(update_query)).rowcount:
+        query = select(model).where(where)
+    else:
+        await db.rollback()
+        return None
+
+    query = query.options(*options).execution_options(populate_existing=True)
+    updated = (await db.execute(query)).scalars().first()
+    if updated is not None:
+        for touch in touches:
+            await db.execute(touch)
+    await db.commit()
+    return updated
+
 
+async def update_customer_email(db: AsyncSession, customer_id: int, new_email: str):
+    return await _update_returning(
+        db, models.Customer, models.Customer.id == customer_id, {"email": new_email}
+    )
 
-def update_customer_by_id(db: Session, customer_id: int, new_details: schemas.CustomerIn):
-    update_query = db.query(models.Customer).filter(models.Customer.id == customer_id)
-    if (update_query.first()):
-        update_query.update(new_details.dict(), synchronize_session=False)
-        db.commit()
-        return update_query.first()
+
+async def update_customer_by_id(db: AsyncSession, customer_id: int, new_details: schemas.CustomerIn):
+    customer = await _update_returning(
+        db, models.Customer, models.Customer.id == customer_id, new_details.dict()
+    )
+    if (customer):
+        return customer
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -151,69 +579,83 @@ def update_customer_by_id(db: Session, customer_id: int, new_details: schemas.Cu
 
 
 
-def update_customer_password(db: Session, customer_id: int, new_password: str):
-    update_query = db.query(models.Customer).filter(models.Customer.id == customer_id)
-    if (update_query.first()):
-        update_query.update({"hashed_password": get_password_hash(new_password)}, synchronize_session=False)
-        db.commit()
-        return update_query.first()
+async def update_customer_password(db: AsyncSession, customer_id: int, new_password: str):
+    return await _update_returning(
+        db, models.Customer, models.Customer.id == customer_id,
+        {"hashed_password": await _hash_password(db, new_password)}
+    )
 
 
 
-def update_image(db: Session, image_id: int, **details):
-    update_query = db.query(models.Image).filter(models.Image.id == image_id)
-    if (update_query.first()):
-        try:
-            update_query.update(details, synchronize_session=False)
-            db.commit()
-            return update_query.first()
-        except:
-            raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="Invalid Fields for updating models.Image"
-            )
-            
+async def update_image(db: AsyncSession, image_id: int, **details):
+    try:
+        image = await _update_returning(
+            db, models.Image, models.Image.id == image_id, details,
+            touches=_touch_product_of_image(image_id)
+        )
+    except (exc.ArgumentError, exc.CompileError, exc.StatementError):
+        # unknown columns or values they can't take; anything else (a busy
+        # pool, a cancelled request) isn't about the fields and propagates
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid Fields for updating models.Image"
+        )
+
+    if (image):
+        await _invalidate_product(db, image.product_id)
+    return image
 
 
-def update_order(db: Session, order_id: int, new_details: schemas.OrderIn):
-    update_query = db.query(models.Order).filter(models.Order.id == order_id)
-    if (update_query.first()):
-        update_query.update(new_details.dict(), synchronize_session=False)
-        db.commit()
-        return update_query.first()
+
+async def update_order(db: AsyncSession, order_id: int, new_details: schemas.OrderIn):
+    order = await _update_returning(
+        db, models.Order, models.Order.id == order_id, new_details.dict()
+    )
+    if (order):
+        return order
     else:
         return -1
 
 
-def update_product(db: Session, product_id: int, new_details: schemas.ProductIn):
-    update_query = db.query(models.Product).filter(models.Product.id == product_id)
-    if (update_query.first()):
-        update_query.update(new_details.dict(), synchronize_session=False)
-        db.commit()
-        return update_query.first()
-    else:
+async def update_product(db: AsyncSession, product_id: int, new_details: schemas.ProductIn, seller_id: int):
+    # only the seller's own product is updated, checked by the UPDATE itself;
+    # why nothing matched is looked up only when nothing did
+    product = await _update_returning(
+        db, models.Product,
+        and_(models.Product.id == product_id, models.Product.seller_id == seller_id),
+        new_details.dict(), *product_out_options, touches=(_touch_seller(seller_id),)
+    )
+    if (product):
+        catalog_cache.invalidate_product(product_id, product.version_id)
+        return product
+
+    if await get_version_id(db, models.Product, product_id) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No Product with product_id = {product_id} in database"
         )
+    raise HTTPException(
+        status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+        detail="Current User isn't Allowed To Perform This Operation"
+    )
 
 
-def update_seller_email(db: Session, seller_id: int, new_email: str):
-    update_query = db.query(models.Seller).filter(models.Seller.id == seller_id)
-    if (update_query.first()):
-        update_query.update({"email": new_email}, synchronize_session=False)
-        db.commit()
-        return update_query.first()
+async def update_seller_email(db: AsyncSession, seller_id: int, new_email: str):
+    seller = await _update_returning(
+        db, models.Seller, models.Seller.id == seller_id, {"email": new_email}
+    )
+    if (seller):
+        return seller
     else:
         return -1
 
 
-def update_seller_by_id(db: Session, seller_id: int, new_details: schemas.SellerIn):
-    update_query = db.query(models.Seller).filter(models.Seller.id == seller_id)
-    if (update_query.first()):
-        update_query.update(new_details.dict(), synchronize_session=False)
-        db.commit()
-        return update_query.first()
+async def update_seller_by_id(db: AsyncSession, seller_id: int, new_details: schemas.SellerIn):
+    seller = await _update_returning(
+        db, models.Seller, models.Seller.id == seller_id, new_details.dict()
+    )
+    if (seller):
+        return seller
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -221,12 +663,13 @@ def update_seller_by_id(db: Session, seller_id: int, new_details: schemas.Seller
         )
 
 
-def update_seller_password(db: Session, seller_id: int, new_password: str):
-    update_query = db.query(models.Seller).filter(models.Seller.id == seller_id)
-    if (update_query.first()):
-        update_query.update({"hashed_password": get_password_hash(new_password)}, synchronize_session=False)
-        db.commit()
-        return update_query.first()
+async def update_seller_password(db: AsyncSession, seller_id: int, new_password: str):
+    seller = await _update_returning(
+        db, models.Seller, models.Seller.id == seller_id,
+        {"hashed_password": await _hash_password(db, new_password)}
+    )
+    if (seller):
+        return seller
     else:
         return -1
 
@@ -234,72 +677,85 @@ def update_seller_password(db: Session, seller_id: int, new_password: str):
 
 ## Delete ##
 
-def delete_bank_account(db: Session, acc_number: str):
-    account = db.query(models.Account).filter(models.Account.acc_number == acc_number).first()
+async def delete_bank_account(db: AsyncSession, acc_number: str):
+    query = select(models.Account).where(models.Account.acc_number == acc_number)
+    account = (await db.execute(query)).scalars().first()
     if account:
         to_return = schemas.AccountDB(**account)
-        db.delete(account)
-        db.commit()
+        await db.delete(account)
+        await db.commit()
         return to_return
     else:
         return -1
 
-def delete_card(db: Session, card_number: str):
-    card = db.query(models.Card).filter(models.Card.card_number == card_number).first()
+async def delete_card(db: AsyncSession, card_number: str):
+    query = select(models.Card).where(models.Card.card_number == card_number)
+    card = (await db.execute(query)).scalars().first()
     if card:
         to_return = schemas.CardDB(**card)
-        db.delete(card)
-        db.commit()
+        await db.delete(card)
+        await db.commit()
         return to_return
     else:
         return -1
 
-def delete_customer(db: Session, customer_id: int):
-    customer = db.query(models.Customer).filter(models.Customer.id == customer_id).first()
+async def delete_customer(db: AsyncSession, customer_id: int):
+    query = select(models.Customer).where(models.Customer.id == customer_id)
+    customer = (await db.execute(query)).scalars().first()
     if customer:
         to_return = schemas.CustomerDB(**customer)
-        db.delete(customer)
-        db.commit()
+        await db.delete(customer)
+        await db.commit()
         return to_return
     else:
         return -1
 
-def delete_image(db: Session, image_id: int):
-    image = db.query(models.Image).filter(models.Image.id == image_id).first()
+async def delete_image(db: AsyncSession, image_id: int):
+    query = select(models.Image).where(models.Image.id == image_id)
+    image = (await db.execute(query)).scalars().first()
     if image:
         to_return = schemas.ImageOut(**image)
-        db.delete(image)
-        db.commit()
+        for touch in _touch_product_of_image(image_id):
+            await db.execute(touch)
+        await db.delete(image)
+        await db.commit()
+        await _invalidate_product(db, image.product_id)
         return to_return
     else:
         return -1
 
-def delete_order(db: Session, order_id: int):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+async def delete_order(db: AsyncSession, order_id: int):
+    query = select(models.Order).where(models.Order.id == order_id)
+    order = (await db.execute(query)).scalars().first()
     if order:
         to_return = schemas.OrderDB(**order)
-        db.delete(order)
-        db.commit()
+        await db.delete(order)
+        await db.commit()
         return to_return
     else:
         return -1
 
-def delete_product(db: Session, product_id: int):
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+async def delete_product(db: AsyncSession, product_id: int):
+    query = select(models.Product).where(models.Product.id == product_id)
+    product = (await db.execute(query)).scalars().first()
     if product:
         to_return = schemas.ProductDB(**product)
-        db.delete(product)
-        db.commit()
+        await db.execute(_touch_seller(product.seller_id))
+        await db.delete(product)
+        await db.commit()
+        # no version is cached again, a load of the deleted product is stale
+        catalog_cache.invalidate_product(product_id, product.version_id + 1)
         return to_return
     else:
         return -1
 
-def delete_seller(db: Session, seller_id: int):
-    seller = db.query(models.Seller).filter(models.Seller.id == seller_id).first()
+async def delete_seller(db: AsyncSession, seller_id: int):
+    query = select(models.Seller).where(models.Seller.id == seller_id)
+    seller = (await db.execute(query)).scalars().first()
     if seller:
         to_return = schemas.SellerDB(**seller)
-        db.delete(seller)
-        db.commit()
+        await db.delete(seller)
+        await db.commit()
         return to_return
     else:
         return -1
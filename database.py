@@ -1,26 +1,246 @@
+from contextlib import asynccontextmanager
 from urllib.parse import quote_plus
+import itertools
 import os
+import time
 
 from dotenv import load_dotenv, find_dotenv
+from fastapi import HTTPException, status
 from sqlalchemy import create_engine
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+import metrics
+
 
 # loading environment variables from .env file
 load_dotenv(find_dotenv())
 SQLALCHEMY_DATABASE_URL = os.environ.get("SQLALCHEMY_DATABASE_URL", "SQLALCHEMY_DATABASE_URL_ABSENT")
 
 
+# async drivers used by the request handlers for each supported backend
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+SQLALCHEMY_ASYNC_DATABASE_URL = os.environ.get("SQLALCHEMY_ASYNC_DATABASE_URL") \
+                                    or to_async_url(SQLALCHEMY_DATABASE_URL)
+# comma separated read replicas of SQLALCHEMY_DATABASE_URL, used by get_read_db
+SQLALCHEMY_REPLICA_URLS = [
+    url.strip() for url in os.environ.get("SQLALCHEMY_REPLICA_URLS", "").split(",") if url.strip()
+]
+# seconds an unreachable replica is skipped before being tried again
+REPLICA_RETRY_SECONDS = float(os.environ.get("REPLICA_RETRY_SECONDS", "30"))
+
+
+# connection pool of the request serving engine
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+# seconds a request may wait for a pooled connection before failing with 503
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "2"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "5000"))
 
+
+def async_engine_options(url):
+    url = make_url(url)
+    if url.get_backend_name() != "postgresql":
+        return {}
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if DB_STATEMENT_TIMEOUT_MS and url.drivername == "postgresql+asyncpg":
+        options["connect_args"] = {
+            "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        }
+    return options
+
+
+
+# synchronous engine, used for schema management and offline scripts
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+metrics.instrument_engine(engine)
+
+# asynchronous engine, used by the request handlers so that waiting on the
+# database doesn't block the event loop
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL, **async_engine_options(SQLALCHEMY_ASYNC_DATABASE_URL)
+)
+def async_sessionmaker(bind):
+    return sessionmaker(
+        bind,
+        class_=AsyncSession,
+        autocommit=False,
+        autoflush=False,
+        # objects returned by crud are serialized after commit; expiring them
+        # would require lazy loads, which AsyncSession doesn't allow
+        expire_on_commit=False,
+    )
+
+
+AsyncSessionLocal = async_sessionmaker(async_engine)
+metrics.instrument_engine(async_engine)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+
+
+class CheckoutStats:
+    def __init__(self):
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+
+checkout_stats = CheckoutStats()
+
+
+def pool_status(pool=None, checkouts: CheckoutStats = checkout_stats):
+    pool = pool or async_engine.pool
+    stats = {
+        "pool": type(pool).__name__,
+        "waiting": checkouts.waiting,
+        "checkouts": checkouts.checkouts,
+        "timeouts": checkouts.timeouts,
+        "wait_seconds_total": checkouts.wait_seconds_total,
+        "wait_seconds_max": checkouts.wait_seconds_max,
+    }
+    # NullPool / StaticPool (SQLite) don't keep these counters
+    for counter in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, counter):
+            stats[counter] = getattr(pool, counter)()
+    return stats
+
+
+async def timed_checkout(db: AsyncSession, stats: CheckoutStats = checkout_stats):
+    stats.waiting += 1
+    start = time.perf_counter()
     try:
-        yield db
+        await db.connection()
+    except exc.TimeoutError:
+        stats.timeouts += 1
+        raise
     finally:
-        db.close()
+        waited = time.perf_counter() - start
+        stats.waiting -= 1
+        stats.wait_seconds_total += waited
+        stats.wait_seconds_max = max(stats.wait_seconds_max, waited)
+
+    stats.checkouts += 1
+
+
+async def checkout_connection(db: AsyncSession):
+    # the connection is checked out up front, so that a saturated pool
+    # turns into a fast 503 instead of a request stalled halfway through
+    try:
+        await timed_checkout(db)
+    except exc.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        await checkout_connection(db)
+        yield db
+
+
+
+class Replica:
+    def __init__(self, url: str):
+        async_url = to_async_url(url)
+        self.url = async_url
+        self.engine = create_async_engine(async_url, **async_engine_options(async_url))
+        self.session_factory = async_sessionmaker(self.engine)
+        metrics.instrument_engine(self.engine)
+        self.checkout_stats = CheckoutStats()
+        self.down_until = 0.0
+
+    @property
+    def healthy(self):
+        return self.down_until <= time.monotonic()
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+
+
+replicas = [Replica(url) for url in SQLALCHEMY_REPLICA_URLS]
+_replica_turn = itertools.count()
+
+
+def replicas_in_rotation():
+    if not replicas:
+        return []
+
+    start = next(_replica_turn) % len(replicas)
+    rotation = replicas[start:] + replicas[:start]
+    return [replica for replica in rotation if replica.healthy]
+
+
+@asynccontextmanager
+async def read_session(use_replicas: bool = True):
+    # read only sessions go round-robin over the healthy replicas; a replica
+    # that can't hand out a connection is taken out of rotation for
+    # REPLICA_RETRY_SECONDS and the next one (finally the primary) is used.
+    # Reads that must see the latest writes pass use_replicas=False
+    for replica in (replicas_in_rotation() if use_replicas else []):
+        async with replica.session_factory() as db:
+            try:
+                await timed_checkout(db, replica.checkout_stats)
+            except exc.TimeoutError:
+                continue
+            except Exception:
+                # anything else failing the checkout (refused, unknown
+                # database or role, bad password, too many connections, still
+                # starting up, ...) means the replica can't serve; asyncpg
+                # raises most of these unwrapped by SQLAlchemy
+                replica.mark_down()
+                continue
+
+            yield db
+            return
+
+    async with AsyncSessionLocal() as db:
+        await checkout_connection(db)
+        yield db
+
+
+async def get_read_db():
+    async with read_session() as db:
+        yield db
+
+
+def all_pools_status():
+    return {
+        "primary": pool_status(),
+        "replicas": [
+            {
+                "url": repr(replica.url),
+                "healthy": replica.healthy,
+                **pool_status(replica.engine.pool, replica.checkout_stats),
+            }
+            for replica in replicas
+        ],
+    }
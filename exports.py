@@ -0,0 +1,67 @@
+from datetime import date
+import csv
+import io
+import os
+
+import orjson
+from dotenv import load_dotenv, find_dotenv
+
+from database import read_session
+import crud, schemas, serializers
+
+
+# loading environment variables from .env file
+load_dotenv(find_dotenv())
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+
+ORDER_FIELDS = list(schemas.OrderOut.__fields__)
+# rows are serialized as schemas.OrderOut, like every other order read
+order_to_dict = serializers.row_to_dict(schemas.OrderOut)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+async def seller_orders_ndjson(seller_id: int):
+    async with read_session() as db:
+        async for rows in crud.stream_orders_by_seller(db, seller_id, EXPORT_BATCH_SIZE):
+            yield b"".join(
+                orjson.dumps(order_to_dict(row), option=orjson.OPT_APPEND_NEWLINE) for row in rows
+            )
+
+
+def csv_value(value):
+    # cells read the way the JSON of the API does: true / false, ISO 8601
+    # dates and times
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+async def seller_orders_csv(seller_id: int):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_FIELDS)
+
+    async with read_session() as db:
+        async for rows in crud.stream_orders_by_seller(db, seller_id, EXPORT_BATCH_SIZE):
+            writer.writerows(
+                [csv_value(value) for value in order_to_dict(row).values()] for row in rows
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORTERS = {
+    "ndjson": seller_orders_ndjson,
+    "csv": seller_orders_csv,
+}
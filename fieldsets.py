@@ -0,0 +1,35 @@
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel
+
+
+# ?fields=id,name,price limits a read to some fields of its response
+# schema: only their columns are loaded (see crud.load_options) and only
+# they are serialized (see serializers.field_plan)
+
+
+def sparse_fields(schema: type[BaseModel]):
+    names = tuple(schema.__fields__)
+
+    def dependency(
+        fields: str | None = Query(
+            default=None, description="comma separated fields to return, of: " + ", ".join(names)
+        )
+    ) -> frozenset[str] | None:
+        if fields is None:
+            return None
+
+        requested = frozenset(name.strip() for name in fields.split(",") if name.strip())
+        unknown = requested.difference(names)
+        if not requested or unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}" if unknown else "No fields requested"
+            )
+        return requested
+    return dependency
+
+
+def fields_key(fields: frozenset[str] | None):
+    # part of the cache keys and ETags of a sparse response, every fieldset
+    # is a representation of its own
+    return "+".join(sorted(fields)) if fields else ""
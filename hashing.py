@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv, find_dotenv
+from fastapi import HTTPException, status
+
+from metrics import Histogram, LATENCY_BUCKETS
+
+
+# loading environment variables from .env file
+load_dotenv(find_dotenv())
+
+# bcrypt releases the GIL while hashing, so a thread pool gives real
+# parallelism without pickling overhead; keep it at most one thread per core
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS", os.cpu_count() or 1))
+# hashes allowed to wait for a worker before new ones are rejected with 503
+BCRYPT_MAX_PENDING = int(os.environ.get("BCRYPT_MAX_PENDING", "32"))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
+
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_in_flight = 0
+rejected = 0
+# time a worker spends on a hash, waiting for a worker isn't included
+hash_seconds = Histogram(LATENCY_BUCKETS)
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        hash_seconds.observe(time.perf_counter() - start)
+
+
+async def run_in_hash_pool(fn, *args):
+    global _in_flight, rejected
+    if _in_flight >= BCRYPT_WORKERS + BCRYPT_MAX_PENDING:
+        rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, _timed, fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+def stats():
+    return {
+        "workers": BCRYPT_WORKERS,
+        "in_flight": _in_flight,
+        "rejected": rejected,
+    }
+
+
+
+def calibrate(target_ms: float, samples: int, min_rounds: int, max_rounds: int):
+    from passlib.hash import bcrypt
+
+    recommended = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        hasher = bcrypt.using(rounds=rounds)
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.hash("calibration-password")
+            timings.append((time.perf_counter() - start) * 1000)
+
+        median = sorted(timings)[len(timings) // 2]
+        print(f"rounds={rounds:<3} {median:8.1f} ms/hash  {1000 / median:8.1f} hashes/s/core")
+        if median <= target_ms:
+            recommended = rounds
+        else:
+            break
+
+    print()
+    print(f"BCRYPT_ROUNDS={recommended}")
+    print(f"BCRYPT_WORKERS={os.cpu_count() or 1}")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark bcrypt cost on this host")
+    parser.add_argument("--target-ms", type=float, default=250.0,
+                        help="highest acceptable time for a single hash")
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=15)
+    args = parser.parse_args()
+
+    calibrate(args.target_ms, args.samples, args.min_rounds, args.max_rounds)
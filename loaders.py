@@ -0,0 +1,75 @@
+import asyncio
+from functools import partial
+
+
+# DataLoader style batching: lookups by key made by concurrent code of one
+# request (asyncio.gather over the items of a cart, a seller_out per seller
+# of /sellers/batch, ...) are collected while the event loop is busy and
+# fetched with a single statement, instead of one query per key
+
+
+class BatchLoader:
+    """Coalesces load(key) calls into batch_fn(keys) calls.
+
+    batch_fn returns a dict of the keys it found, a missing key loads as
+    None. Results are memoized for the life of the loader (a session).
+    """
+
+    def __init__(self, batch_fn, lock: asyncio.Lock | None = None):
+        self.batch_fn = batch_fn
+        self.futures = {}
+        self.queue = []
+        self.dispatch_scheduled = False
+        # a session runs one statement at a time: every loader of a session
+        # shares its lock, batches queued while one is running wait for it
+        self.lock = lock or asyncio.Lock()
+        # the event loop only keeps weak references to tasks, a dispatch
+        # task is kept here until it's done
+        self.tasks = set()
+
+    def load(self, key) -> asyncio.Future:
+        future = self.futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.futures[key] = loop.create_future()
+            self.queue.append(key)
+            if not self.dispatch_scheduled:
+                # runs after the callbacks already ready, which is where the
+                # other tasks of a gather make their own load calls
+                self.dispatch_scheduled = True
+                loop.call_soon(self.start_dispatch)
+        return future
+
+    def start_dispatch(self):
+        task = asyncio.get_running_loop().create_task(self.dispatch())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def load_many(self, keys):
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    async def dispatch(self):
+        keys, self.queue = self.queue, []
+        self.dispatch_scheduled = False
+        async with self.lock:
+            try:
+                found = await self.batch_fn(keys)
+            except Exception as exception:
+                for key in keys:
+                    # not memoized, a later load retries
+                    self.futures.pop(key).set_exception(exception)
+                return
+
+        for key in keys:
+            self.futures[key].set_result(found.get(key))
+
+
+def loader(db, batch_fn) -> BatchLoader:
+    # the loader of batch_fn(db, keys) for this session, so every lookup of
+    # a request goes through the same one; batch_fn has to be a module level
+    # function (not a fresh partial or lambda) to be found again
+    loaders = db.info.setdefault("loaders", {})
+    if batch_fn not in loaders:
+        lock = db.info.setdefault("loaders_lock", asyncio.Lock())
+        loaders[batch_fn] = BatchLoader(partial(batch_fn, db), lock)
+    return loaders[batch_fn]
@@ -1,19 +1,49 @@
-from datetime import date
-
-from pydantic import EmailStr, HttpUrl
+from datetime import date, datetime, timedelta, timezone
+import asyncio
+import hashlib
+import os
+import secrets
+import time
+from urllib.parse import urlencode
+
+# cold start is measured from here, before the heavy imports below
+IMPORT_STARTED = time.perf_counter()
+
+import orjson
+from pydantic import BaseModel, EmailStr, HttpUrl
 from fastapi import FastAPI
-from fastapi import Depends, HTTPException, status
-from fastapi import Query, Form, Body
-from sqlalchemy.orm import Session
+from fastapi import Depends, HTTPException, Response, status
+from fastapi import Query, Form, Body, Header
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import configure_mappers
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from database import engine, get_db
-import crud
+from database import get_db, get_read_db, read_session, all_pools_status
+import catalog_cache, hashing, metrics, singleflight
+import crud, exports, loaders, serializers
 import models, schemas, security, extras
-
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
+from pagination import encode_cursor, decode_cursor
+from fieldsets import sparse_fields, fields_key
+
+# tables are created and altered by migrate.py, run it before starting the app
+
+# most products a seller may create with a single POST /products/bulk
+BULK_MAX_PRODUCTS = int(os.environ.get("BULK_MAX_PRODUCTS", "5000"))
+# seconds shared caches (the CDN in front of us) may serve catalog and
+# profile reads before revalidating them with If-None-Match
+CATALOG_MAX_AGE = int(os.environ.get("CATALOG_MAX_AGE", "60"))
+# products embedded in a seller's profile, the rest are paged through
+# /products/seller/{seller_id}
+SELLER_PROFILE_PRODUCTS = int(os.environ.get("SELLER_PROFILE_PRODUCTS", "10"))
+# most ids a single /products/batch or /sellers/batch may ask for
+BATCH_MAX_IDS = int(os.environ.get("BATCH_MAX_IDS", "100"))
+# bearer token of the /internal endpoints, which are disabled (404) when
+# it isn't set
+INTERNAL_TOKEN = os.environ.get("INTERNAL_TOKEN", "")
+
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(
     security.router,
@@ -21,13 +51,42 @@ app.include_router(
     tags=["auth"],
 )
 
+# concurrent misses of a hot read (a product that went viral) share one
+# query and one serialized body, by the key of what they read
+flights = {
+    "product": singleflight.Group(),
+    "image": singleflight.Group(),
+    "seller": singleflight.Group(),
+}
+
+# seconds spent importing this module and warming it up, per worker
+startup_seconds = {}
+
+
+@app.on_event("startup")
+def warm_up():
+    # work the first requests would otherwise pay for, done before the
+    # worker accepts connections: mapper configuration, serializer plans
+    # of the response schemas and the openapi document
+    start = time.perf_counter()
+    startup_seconds["import"] = start - IMPORT_STARTED
+
+    configure_mappers()
+    for route in app.routes:
+        field = getattr(route, "response_field", None)
+        if field is not None and isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            serializers.field_plan(field.type_)
+    app.openapi()
+
+    startup_seconds["warm_up"] = time.perf_counter() - start
+
 #####################################################################
 #                           get methods                             #
 #####################################################################
 
 @app.get("/customers/id/{id}", response_model=schemas.CustomeOut)
-async def get_customer_by_id(id: int, db: Session = Depends(get_db)):
-    customer = crud.get_customer(db=db, customer_id=id)
+async def get_customer_by_id(id: int, db: AsyncSession = Depends(get_read_db)):
+    customer = await crud.get_customer(db=db, customer_id=id)
     if customer:
         return customer
     else:
@@ -38,8 +97,8 @@ async def get_customer_by_id(id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/customers/email/{email}", response_model=schemas.CustomeOut)
-async def get_customer_by_email(email: EmailStr, db: Session = Depends(get_db)):
-    customer = crud.get_customer_by_email(db=db, email=email)
+async def get_customer_by_email(email: EmailStr, db: AsyncSession = Depends(get_read_db)):
+    customer = await crud.get_customer_by_email(db=db, email=email)
     if customer:
         return customer
     else:
@@ -50,11 +109,11 @@ async def get_customer_by_email(email: EmailStr, db: Session = Depends(get_db)):
 
 @app.get("/customers/me", response_model=schemas.CustomeOut)
 async def get_current_customer(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (not user.isSeller):
-        return crud.get_customer(db, customer_id=user.id)
+        return await crud.get_customer(db, customer_id=user.id)
     else:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -63,15 +122,21 @@ async def get_current_customer(
                     "Try creating a customer account or /sellers/me"
         )
 
-@app.get("/customers/me/orders", response_model=list[schemas.OrderOut], include_in_schema=False)
+@app.get("/customers/me/orders", response_model=list[schemas.OrderOut])
 async def get_orders_of_current_customer_by_date(
     start: date = Query(),
     end: date = Query(),
-    db: Session = Depends(get_db),
+    limit: int = Query(default=100, ge=1, le=1000),
+    after: str | None = None,
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.OrderOut)),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (not user.isSeller):
-        orders = db.query(models.Order).filter(models.Order.customer_id == user.id).all()
+        orders = await crud.get_orders_by_customer_between(
+            db, user.id, *placed_between(start, end),
+            limit=limit, after=decode_order_cursor(after), fields=fields
+        )
     else:
         raise HTTPException(
             status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -79,7 +144,8 @@ async def get_orders_of_current_customer_by_date(
         )
     
     if orders:
-        return orders
+        next_cursor = encode_order_cursor(orders[-1]) if len(orders) == limit else None
+        return json_response(serializers.dumps(schemas.OrderOut, orders, fields), next_cursor)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -89,11 +155,12 @@ async def get_orders_of_current_customer_by_date(
 
 @app.get("/customers/me/orders/all", response_model=list[schemas.OrderOut])
 async def get_all_orders_of_current_customer(
-    db: Session = Depends(get_db),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.OrderOut)),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (not user.isSeller):
-        orders = db.query(models.Order).filter(models.Order.customer_id == user.id).all()
+        orders = await crud.get_orders_by_customer(db, customer_id=user.id, fields=fields)
     else:
         raise HTTPException(
             status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -101,7 +168,7 @@ async def get_all_orders_of_current_customer(
         )
     
     if orders:
-        return orders
+        return json_response(serializers.dumps(schemas.OrderOut, orders, fields))
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -111,11 +178,11 @@ async def get_all_orders_of_current_customer(
 
 @app.get("/cutomers/me/cards", response_model=list[schemas.CardOut])
 async def get_my_cards(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (not user.isSeller):
-        cards = crud.get_cards(db, customer_id=user.id)
+        cards = await crud.get_cards(db, customer_id=user.id)
     else:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -133,10 +200,15 @@ async def get_my_cards(
 
 
 @app.get("/images/{image_id}", response_model=schemas.ImageOut)
-async def get_image_by_id(image_id: int, db: Session = Depends(get_db)):
-    image = crud.get_image(db=db, image_id=image_id)
-    if image:
-        return image
+async def get_image_by_id(image_id: int, if_none_match: str | None = Header(default=None)):
+    unchanged = await check_not_modified(if_none_match, models.Image, image_id)
+    if unchanged:
+        return unchanged
+
+    loaded = await flights["image"].do(image_id, load_image, image_id)
+    if loaded:
+        body, etag = loaded
+        return json_response(body, etag=etag)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -145,10 +217,14 @@ async def get_image_by_id(image_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/orders/{id}", response_model=schemas.OrderOut)
-async def get_order(id: int, db: Session = Depends(get_db)):
-    order = crud.get_order(db=db, order_id=id)
+async def get_order(
+    id: int,
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.OrderOut)),
+    db: AsyncSession = Depends(get_db)
+):
+    order = await crud.get_order(db=db, order_id=id, fields=fields)
     if order:
-        return order
+        return json_response(serializers.dump(schemas.OrderOut, order, fields))
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -157,52 +233,138 @@ async def get_order(id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/products", response_model=list[schemas.ProductOut])
-async def get_products(offset: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    products = db.query(models.Product).offset(offset=offset).limit(limit=limit).all()
-    if products:
-        return products
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Requested Data Isn't Available at server"
-        )
+async def get_products(
+    offset: int = 0,
+    limit: int = 10,
+    after: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.ProductOut)),
+):
+    cache_key = catalog_cache.listing_key("products", offset, limit, after, fields_key(fields))
+    cached = catalog_cache.get(cache_key)
+    if cached is None:
+        after_id = decode_id_cursor(after, "id")["id"] if after else None
+        async with read_session(use_replicas=not catalog_cache.recently_written()) as db:
+            products = await crud.get_products(
+                db, limit=limit, offset=offset, after_id=after_id, fields=fields
+            )
+        if not products:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Requested Data Isn't Available at server"
+            )
+
+        next_cursor = encode_cursor(id=products[-1].id) if len(products) == limit else None
+        body = serializers.dumps(schemas.ProductOut, products, fields)
+        cached = (body, next_cursor, body_etag(body))
+        catalog_cache.set(cache_key, cached)
+
+    return catalog_listing_response(if_none_match, *cached)
 
 @app.get("/products/seller/{seller_id}", response_model=list[schemas.ProductOut])
 async def get_product_by_seller_id(
     seller_id: int,
     offset: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_db)
+    after: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.ProductOut)),
 ):
-    products = db.query(models.Product)\
-                    .filter(models.Product.seller_id == seller_id)\
-                    .offset(offset=offset).limit(limit=limit).all()
-    if products:
-        return products
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Requested Data Isn't Available at server"
-        )
+    cache_key = catalog_cache.listing_key("seller-products", seller_id, offset, limit, after, fields_key(fields))
+    cached = catalog_cache.get(cache_key)
+    if cached is None:
+        async with read_session(use_replicas=not catalog_cache.recently_written()) as db:
+            products, next_cursor = await get_seller_products_page(
+                db, seller_id, offset, limit, after, fields
+            )
+        if not products:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Requested Data Isn't Available at server"
+            )
+
+        body = serializers.dumps(schemas.ProductOut, products, fields)
+        cached = (body, next_cursor, body_etag(body))
+        catalog_cache.set(cache_key, cached)
+
+    return catalog_listing_response(if_none_match, *cached)
+
+
+# registered ahead of /products/{id}, which would otherwise capture it
+@app.get("/products/batch", response_model=list[schemas.ProductOut])
+async def get_products_batch(
+    ids: str = Query(description="comma separated product ids"),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.ProductOut)),
+):
+    # the products found, in the order asked for; ids that don't exist are left out
+    product_ids = parse_ids(ids)
+    async with read_session() as db:
+        found = await crud.get_products_by_ids(db, product_ids, fields)
+    products = [found[id] for id in product_ids if id in found]
+    return json_response(serializers.dumps(schemas.ProductOut, products, fields))
+
+
+# registered ahead of /products/{id}, which would otherwise capture it
+@app.get("/products/search", response_model=list[schemas.ProductOut])
+async def search_products(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=10, ge=1, le=100),
+    after: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.ProductOut)),
+):
+    cache_key = catalog_cache.listing_key("search", q, limit, after, fields_key(fields))
+    cached = catalog_cache.get(cache_key)
+    if cached is None:
+        async with read_session(use_replicas=not catalog_cache.recently_written()) as db:
+            products, next_cursor = await get_search_page(db, q, limit, after, fields)
+
+        body = serializers.dumps(schemas.ProductOut, products, fields)
+        cached = (body, next_cursor, body_etag(body))
+        catalog_cache.set(cache_key, cached)
+
+    return catalog_listing_response(if_none_match, *cached)
 
 
 @app.get("/products/{id}", response_model=schemas.ProductOut)
-async def get_product_by_id(id: int, db: Session = Depends(get_db)):
-    product = crud.get_product(db=db, product_id=id)
-    if product:
-        return product
+async def get_product_by_id(
+    id: int,
+    if_none_match: str | None = Header(default=None),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.ProductOut)),
+):
+    # sparse fieldsets are cached under listing keys, which every catalog
+    # write invalidates; the full product has a key of its own
+    if fields is None:
+        cache_key = catalog_cache.product_key(id)
     else:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Requested Data Isn't Available at server"
-        )
+        cache_key = catalog_cache.listing_key("product", id, fields_key(fields))
+    cached = catalog_cache.get(cache_key)
+    if cached is None:
+        unchanged = await check_not_modified(if_none_match, models.Product, id, fields)
+        if unchanged:
+            return unchanged
+        cached = await flights["product"].do(cache_key, load_product, cache_key, id, fields)
+
+    body, etag = cached
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return json_response(body, etag=etag)
 
 
 @app.get("/sellers/id/{id}", response_model=schemas.SellerOut)
-async def get_seller(id: int, db: Session = Depends(get_db)):
-    seller = crud.get_seller(db=db, seller_id=id)
-    if seller:
-        return seller
+async def get_seller(
+    id: int,
+    if_none_match: str | None = Header(default=None),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.SellerOut)),
+):
+    unchanged = await check_not_modified(if_none_match, models.Seller, id, fields)
+    if unchanged:
+        return unchanged
+
+    loaded = await flights["seller"].do((id, fields_key(fields)), load_seller, id, fields)
+    if loaded:
+        body, etag = loaded
+        return json_response(body, etag=etag)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -210,11 +372,30 @@ async def get_seller(id: int, db: Session = Depends(get_db)):
         )
 
 
+@app.get("/sellers/batch", response_model=list[schemas.SellerOut])
+async def get_sellers_batch(
+    ids: str = Query(description="comma separated seller ids"),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.SellerOut)),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # the sellers found, in the order asked for; ids that don't exist are left out
+    seller_ids = parse_ids(ids)
+    found = await crud.get_sellers_by_ids(db, seller_ids, seller_row_fields(fields))
+    profiles = await asyncio.gather(*(
+        seller_out(db, found[id], fields) for id in seller_ids if id in found
+    ))
+    return json_response(b"[" + b",".join(profiles) + b"]")
+
+
 @app.get("/sellers/email/{email}", response_model=schemas.SellerOut)
-async def get_seller_by_email(email: EmailStr, db: Session = Depends(get_db)):
-    seller = crud.get_seller_by_email(db=db, email=email)
+async def get_seller_by_email(
+    email: EmailStr,
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.SellerOut)),
+    db: AsyncSession = Depends(get_read_db)
+):
+    seller = await crud.get_seller_by_email(db=db, email=email, fields=seller_row_fields(fields))
     if seller:
-        return seller
+        return json_response(await seller_out(db, seller, fields))
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -224,11 +405,13 @@ async def get_seller_by_email(email: EmailStr, db: Session = Depends(get_db)):
 
 @app.get("/sellers/me", response_model=schemas.SellerOut)
 async def get_current_seller(
-    db: Session = Depends(get_db),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.SellerOut)),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (user.isSeller):
-        return crud.get_seller(db, seller_id=user.id)
+        seller = await crud.get_seller(db, seller_id=user.id, fields=seller_row_fields(fields))
+        return json_response(await seller_out(db, seller, fields))
     else:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -240,11 +423,11 @@ async def get_current_seller(
 
 @app.get("/sellers/me/accounts", response_model=list[schemas.AccountOut])
 async def get_my_bank_accounts(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (user.isSeller):
-        accounts = crud.get_bank_accounts(db, seller_id=user.id)
+        accounts = await crud.get_bank_accounts(db, seller_id=user.id)
     else:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -261,14 +444,21 @@ async def get_my_bank_accounts(
         )
 
 
-@app.get("/sellers/me/orders", response_model=list[schemas.OrderOut], include_in_schema=False)
+@app.get("/sellers/me/orders", response_model=list[schemas.OrderOut])
 async def get_orders_of_current_seller_by_date(
-    start: date = Query() , end: date = Query(),
-    db: Session = Depends(get_db),
+    start: date = Query(),
+    end: date = Query(),
+    limit: int = Query(default=100, ge=1, le=1000),
+    after: str | None = None,
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.OrderOut)),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (user.isSeller):
-        orders = db.query(models.Order).filter(models.Order.seller_id == user.id).all()
+        orders = await crud.get_orders_by_seller_between(
+            db, user.id, *placed_between(start, end),
+            limit=limit, after=decode_order_cursor(after), fields=fields
+        )
     else:
         raise HTTPException(
             status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -276,7 +466,8 @@ async def get_orders_of_current_seller_by_date(
         )
     
     if orders:
-        return orders
+        next_cursor = encode_order_cursor(orders[-1]) if len(orders) == limit else None
+        return json_response(serializers.dumps(schemas.OrderOut, orders, fields), next_cursor)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -286,11 +477,12 @@ async def get_orders_of_current_seller_by_date(
 
 @app.get("/sellers/me/orders/all", response_model=list[schemas.OrderOut])
 async def get_all_orders_of_current_seller(
-    db: Session = Depends(get_db),
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.OrderOut)),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (user.isSeller):
-        orders = db.query(models.Order).filter(models.Order.seller_id == user.id).all()
+        orders = await crud.get_orders_by_seller(db, seller_id=user.id, fields=fields)
     else:
         raise HTTPException(
             status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -298,25 +490,42 @@ async def get_all_orders_of_current_seller(
         )
     
     if orders:
-        return orders
+        return json_response(serializers.dumps(schemas.OrderOut, orders, fields))
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Requested Data Isn't Available at server"
         )
 
+@app.get("/sellers/me/orders/export")
+async def export_orders_of_current_seller(
+    export_format: str = Query(default="ndjson", alias="format", regex="^(ndjson|csv)$"),
+    user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
+):
+    if (not user.isSeller):
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail="try using /customers/me/orders/all instead"
+        )
+
+    return StreamingResponse(
+        exports.EXPORTERS[export_format](user.id),
+        media_type=exports.MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{export_format}"'},
+    )
+
 @app.get("/sellers/me/products", response_model=list[schemas.ProductOut])
 async def get_product_of_current_seller(
     offset: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_db),
+    after: str | None = None,
+    fields: frozenset[str] | None = Depends(sparse_fields(schemas.ProductOut)),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
-    products = db.query(models.Product)\
-                    .filter(models.Product.seller_id == user.id)\
-                    .offset(offset=offset).limit(limit=limit).all()
+    products, next_cursor = await get_seller_products_page(db, user.id, offset, limit, after, fields)
     if products:
-        return products
+        return json_response(serializers.dumps(schemas.ProductOut, products, fields), next_cursor)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -324,6 +533,259 @@ async def get_product_of_current_seller(
         )
 
 
+async def get_seller_products_page(
+    db: AsyncSession, seller_id: int, offset: int, limit: int, after: str | None,
+    fields: frozenset[str] | None = None
+):
+    after_id = None
+    if after:
+        cursor = decode_id_cursor(after, "seller_id", "id")
+        if cursor["seller_id"] != seller_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Pagination cursor belongs to a different seller"
+            )
+        after_id = cursor["id"]
+
+    products = await crud.get_products_by_seller(
+        db, seller_id=seller_id, limit=limit, offset=offset, after_id=after_id, fields=fields
+    )
+    next_cursor = None
+    if len(products) == limit:
+        next_cursor = encode_cursor(seller_id=seller_id, id=products[-1].id)
+    return products, next_cursor
+
+
+# fields of schemas.SellerOut describing the seller's catalog, not its row
+seller_catalog_fields = frozenset({"product_count", "products", "products_next"})
+
+
+def seller_row_fields(fields: frozenset[str] | None):
+    return None if fields is None else fields - seller_catalog_fields
+
+
+async def seller_out(db: AsyncSession, seller: models.Seller, fields: frozenset[str] | None = None):
+    # serialized schemas.SellerOut of a seller: the size of its catalog and
+    # its first page, the products relationship itself is never loaded; the
+    # catalog isn't queried at all when fields leave it out
+    wanted = schemas.SellerOut.__fields__.keys() if fields is None else fields
+    profile = {
+        name: getattr(seller, name) for name in schemas.SellerOut.__fields__
+        if name in wanted and name not in seller_catalog_fields
+    }
+    if seller_catalog_fields.isdisjoint(wanted):
+        return orjson.dumps(profile)
+
+    # through the session's loaders, so that the profiles of /sellers/batch
+    # share one count and one first page query
+    product_count = await loaders.loader(db, crud.count_products_of_sellers).load(seller.id) or 0
+    products = []
+    if product_count and not {"products", "products_next"}.isdisjoint(wanted):
+        products = await loaders.loader(db, first_products_of_sellers).load(seller.id) or []
+
+    products_next = None
+    if product_count > len(products) and products:
+        products_next = f"/products/seller/{seller.id}?" + urlencode({
+            "limit": SELLER_PROFILE_PRODUCTS,
+            "after": encode_cursor(seller_id=seller.id, id=products[-1].id),
+        })
+    product_to_dict = serializers.row_to_dict(schemas.ProductOut)
+    catalog = {
+        "product_count": product_count,
+        "products": [product_to_dict(product) for product in products],
+        "products_next": products_next,
+    }
+    profile.update((name, value) for name, value in catalog.items() if name in wanted)
+    return orjson.dumps(profile)
+
+
+async def first_products_of_sellers(db: AsyncSession, seller_ids: list[int]):
+    return await crud.get_first_products_of_sellers(db, seller_ids, SELLER_PROFILE_PRODUCTS)
+
+
+def parse_ids(ids: str):
+    # ?ids=1,2,3 in the order given, without repeats
+    try:
+        parsed = list(dict.fromkeys(int(id) for id in ids.split(",") if id.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be comma separated integers"
+        )
+    if not parsed or len(parsed) > BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Between 1 and {BATCH_MAX_IDS} ids may be requested at once"
+        )
+    return parsed
+
+
+# ways a search can match, the first page falls back from full text to
+# similar names when nothing matches; later pages keep the cursor's one
+search_matches = {
+    "text": crud.search_products,
+    "similar": crud.search_products_similar,
+}
+
+
+async def get_search_page(
+    db: AsyncSession, terms: str, limit: int, after: str | None, fields: frozenset[str] | None = None
+):
+    if after:
+        cursor = decode_cursor(after, "match", "rank", "id")
+        try:
+            match, position = cursor["match"], (float(cursor["rank"]), int(cursor["id"]))
+            search = search_matches[match]
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+        rows = await search(db, terms, limit, position, fields)
+    else:
+        match = "text"
+        rows = await crud.search_products(db, terms, limit, fields=fields)
+        if not rows:
+            match = "similar"
+            rows = await crud.search_products_similar(db, terms, limit, fields=fields)
+
+    next_cursor = None
+    if len(rows) == limit:
+        product, rank = rows[-1]
+        next_cursor = encode_cursor(match=match, rank=rank, id=product.id)
+    return [product for product, _ in rows], next_cursor
+
+
+def placed_between(start: date, end: date):
+    # both days are inclusive, in UTC
+    return (
+        datetime.combine(start, datetime.min.time(), tzinfo=timezone.utc),
+        datetime.combine(end + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc),
+    )
+
+
+def encode_order_cursor(order: models.Order):
+    return encode_cursor(placed_at=order.placed_at.isoformat(), id=order.id)
+
+
+def decode_order_cursor(after: str | None):
+    if not after:
+        return None
+
+    cursor = decode_cursor(after, "placed_at", "id")
+    try:
+        return datetime.fromisoformat(cursor["placed_at"]), int(cursor["id"])
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def decode_id_cursor(after: str, *fields: str):
+    # a cursor of integer keys, anything else in it is a bad cursor (400)
+    # rather than a failing query
+    cursor = decode_cursor(after, *fields)
+    try:
+        return {field: int(cursor[field]) for field in fields}
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def json_response(body: bytes, next_cursor: str | None = None, etag: str | None = None):
+    # body is already serialized, see serializers
+    response = Response(content=body, media_type="application/json")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if etag:
+        response.headers.update(cache_headers(etag))
+    return response
+
+
+def version_etag(model, id: int, version_id: int, fields: frozenset[str] | None = None):
+    if fields:
+        return f'"{model.__tablename__}-{id}-{version_id}-{fields_key(fields)}"'
+    return f'"{model.__tablename__}-{id}-{version_id}"'
+
+
+def body_etag(body: bytes):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str):
+    if not if_none_match:
+        return False
+
+    # If-None-Match is compared weakly, W/"x" matches "x"
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def cache_headers(etag: str):
+    return {"ETag": etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+
+
+def not_modified(etag: str):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
+
+
+def catalog_listing_response(if_none_match: str | None, body: bytes, next_cursor: str | None, etag: str):
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return json_response(body, next_cursor, etag)
+
+
+# loads of the hot reads by id, run by flights: each opens a session of its
+# own (it outlives the request of the caller that started it) and returns
+# the serialized body with its ETag, or None when there is no such row
+
+async def load_product(cache_key: str, id: int, fields: frozenset[str] | None):
+    async with read_session() as db:
+        product = await crud.get_product(db=db, product_id=id, fields=fields)
+    loaded = (
+        serializers.dump(schemas.ProductOut, product, fields),
+        version_etag(models.Product, id, product.version_id, fields)
+    )
+    catalog_cache.set_product(cache_key, id, product.version_id, loaded)
+    return loaded
+
+
+async def load_image(id: int):
+    async with read_session() as db:
+        image = await crud.get_image(db=db, image_id=id)
+    if image:
+        return serializers.dump(schemas.ImageOut, image), version_etag(models.Image, id, image.version_id)
+    return None
+
+
+async def load_seller(id: int, fields: frozenset[str] | None):
+    async with read_session() as db:
+        seller = await crud.get_seller(db=db, seller_id=id, fields=seller_row_fields(fields))
+        if seller:
+            return (
+                await seller_out(db, seller, fields),
+                version_etag(models.Seller, id, seller.version_id, fields)
+            )
+    return None
+
+
+async def check_not_modified(if_none_match: str | None, model, id: int, fields: frozenset[str] | None = None):
+    # answers a conditional GET from version_id alone, the row is neither
+    # loaded nor serialized when the client's copy is current; only a
+    # conditional GET takes a connection for it
+    if if_none_match:
+        async with read_session() as db:
+            version_id = await crud.get_version_id(db, model, id)
+        if version_id is not None:
+            etag = version_etag(model, id, version_id, fields)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+    return None
+
+
 
 
 #####################################################################
@@ -337,11 +799,11 @@ async def get_product_of_current_seller(
 
 @app.post("/customers/create", response_model=schemas.CustomeOut)
 async def create_customer(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_customer: schemas.CustomerIn = Body(),
     #password: str = Form() #TODO
 ):
-    return crud.creater_customer(
+    return await crud.creater_customer(
                                     db=db,
                                     customer=new_customer,
                                     password="fakepassword@" + new_customer.email
@@ -350,12 +812,12 @@ async def create_customer(
 
 @app.post("/customer/add/card", response_model=schemas.CardOut)
 async def add_card(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_card: schemas.CardIn = Body(),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (not user.isSeller):
-        return crud.create_card(db, new_card, user.id)
+        return await crud.create_card(db, new_card, user.id)
     else:
         raise HTTPException(
             status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -365,27 +827,40 @@ async def add_card(
 
 @app.post("/orders/place", response_model=schemas.OrderOut)
 async def place_order(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_order: schemas.OrderIn = Body(),
+    idempotency_key: str | None = Header(default=None, max_length=255),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (not user.isSeller):
-        product = crud.get_product(db, new_order.product_id)
-        if (product):
-            if (product.seller_id == new_order.seller_id):
-                return crud.create_order(db=db, order=new_order)
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_406_NOT_ACCEPTABLE,
-                    detail="Seller Passed In new Order isn't same as"
-                            "the seller of product passed in new Order"
-                )
+        # idempotency keys are scoped to the customer, who can only place
+        # orders of their own
+        if (new_order.customer_id != user.id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Orders can only be placed for the logged in customer"
+            )
 
-        else:
+        # a retry with the same Idempotency-Key gets back the order placed
+        # by the first attempt instead of placing another one
+        order = await crud.place_order(db, new_order, idempotency_key)
+        if (order):
+            return order
+
+        # nothing was inserted, find out which check failed; get_product
+        # raises 404 for a product that doesn't exist
+        product = await crud.get_product(db, new_order.product_id)
+        if (product.seller_id != new_order.seller_id):
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Product with id: {new_order.product_id}, Doesn't Exists"
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail="Seller Passed In new Order isn't same as"
+                        "the seller of product passed in new Order"
             )
+        # the product changed while the order was being placed
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Order couldn't be placed, try again"
+        )
 
     else:
         raise HTTPException(
@@ -396,21 +871,22 @@ async def place_order(
 
 @app.post("/sellers/create", response_model=schemas.SellerOut)
 async def create_seller(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_seller: schemas.SellerIn = Body(),
     # password: str = Form() # TODO
 ):
-    return crud.creater_seller(db, new_seller, "fakepassword@" + new_seller.email)
+    seller = await crud.creater_seller(db, new_seller, "fakepassword@" + new_seller.email)
+    return json_response(await seller_out(db, seller))
 
 
 @app.post("/sellers/add/account", response_model=schemas.AccountOut)
 async def add_account(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_account: schemas.AccountIn = Body(),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (user.isSeller):
-        return crud.create_bank_account(db, new_account, user.id)
+        return await crud.create_bank_account(db, new_account, user.id)
     else:
         raise HTTPException(
             status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -420,12 +896,12 @@ async def add_account(
 
 @app.post("/products/create", response_model=schemas.ProductOut)
 async def create_product(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_product: schemas.ProductIn = Body(),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
     if (user.isSeller):
-        return crud.create_product(db, new_product, user.id)
+        return await crud.create_product(db, new_product, user.id)
     else:
         raise HTTPException(
             status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -433,6 +909,53 @@ async def create_product(
         )
 
 
+@app.post("/products/bulk", response_model=schemas.ProductBulkOut)
+async def create_products_bulk(
+    db: AsyncSession = Depends(get_db),
+    rows: list[dict] = Body(max_items=BULK_MAX_PRODUCTS),
+    user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
+):
+    if (not user.isSeller):
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail="Only Sellers Can Edit/Add Product Details"
+        )
+
+    # rows are validated one by one, so that a bad row is reported back
+    # instead of failing the whole request with 422
+    products, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            products.append((index, schemas.ProductBulkIn.parse_obj(row)))
+        except schemas.ValidationError as e:
+            errors.append(schemas.BulkRowError(index=index, errors=e.errors()))
+
+    # image urls are unique, reject rows that would violate it up front
+    # rather than letting the constraint abort the transaction
+    taken = await crud.get_existing_image_urls(
+        db, [image.img for _, product in products for image in product.imgs]
+    )
+    accepted = []
+    for index, product in products:
+        urls = [image.img for image in product.imgs]
+        duplicates = sorted(url for url in set(urls) if url in taken or urls.count(url) > 1)
+        if duplicates:
+            errors.append(schemas.BulkRowError(
+                index=index,
+                errors=[{"loc": ["imgs"], "msg": f"image url already in use: {url}", "type": "value_error.duplicate"}
+                        for url in duplicates]
+            ))
+        else:
+            taken.update(urls)
+            accepted.append(product)
+
+    errors.sort(key=lambda error: error.index)
+    return schemas.ProductBulkOut(
+        created=await crud.create_products_bulk(db, accepted, user.id),
+        errors=errors,
+    )
+
+
 # @app.post("/products/{id}/addImage", response_model=schemas.ImageOut)
 # async def add_image_to_product(
 #     id: int,
@@ -474,11 +997,11 @@ async def create_product(
 @app.put("/customers/{id}/update", response_model=schemas.CustomeOut)
 async def update_customer_by_id(
     id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_details: schemas.CustomerIn = Body(),
     #password: str = Form() #TODO
 ):
-    return crud.update_customer_by_id(
+    return await crud.update_customer_by_id(
                                     db=db,
                                     customer_id=id,
                                     new_details=new_details
@@ -490,25 +1013,26 @@ async def update_customer_by_id(
 @app.put("/sellers/{id}/update", response_model=schemas.SellerOut)
 async def update_seller_by_id(
     id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_details: schemas.SellerIn = Body(),
     # password: str = Form() # TODO
 ):
-    return crud.update_seller_by_id(db=db,
+    seller = await crud.update_seller_by_id(db=db,
                                     seller_id=id,
                                     new_details=new_details
                                 )
+    return json_response(await seller_out(db, seller))
 
 
 @app.put("/products/{id}/update", response_model=schemas.ProductOut)
 async def update_product(
     id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     new_details: schemas.ProductIn = Body(),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
-    if (user.isSeller and crud.get_product(db, id).seller_id == user.id):
-        return crud.update_product(db, id, new_details)
+    if (user.isSeller):
+        return await crud.update_product(db, id, new_details, seller_id=user.id)
     else:
         raise HTTPException(
             status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -520,14 +1044,14 @@ async def update_product(
 async def add_image_to_product(
     id: int,
     new_image: schemas.ImageIn = Body(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user: schemas.TokenData = Depends(security.decode_access_token_if_valid_else_throw_401)
 ):
-    product = crud.get_product(db, id)
+    product = await crud.get_product(db, id)
     if (user.isSeller):
         if (product):
             if (product.seller_id == user.id):
-                return crud.create_image(db, new_image)
+                return await crud.create_image(db, new_image)
             else:
                 raise HTTPException(
                     status_code=status.HTTP_406_NOT_ACCEPTABLE,
@@ -556,6 +1080,84 @@ async def add_image_to_product(
 # TODO after reading about OAuth and JWT tokens
 
 
+#####################################################################
+#                           internal                                #
+#####################################################################
+
+def internal_only(authorization: str | None = Header(default=None)):
+    # pool and cache internals aren't for the public: they need the
+    # INTERNAL_TOKEN, and don't exist without one
+    if not INTERNAL_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest(authorization or "", f"Bearer {INTERNAL_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@app.get("/internal/db/pool", include_in_schema=False, dependencies=[Depends(internal_only)])
+async def get_db_pool_status():
+    return all_pools_status()
+
+
+@app.get("/internal/cache", include_in_schema=False, dependencies=[Depends(internal_only)])
+async def get_cache_stats():
+    return {
+        "catalog": catalog_cache.stats(),
+        "tokens": security.token_cache.stats(),
+        "singleflight": {read: group.stats() for read, group in flights.items()},
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# pool counters reported by database.pool_status, as metric name, type and help
+pool_metrics = {
+    "checkedout": ("db_pool_checked_out", "gauge", "Connections in use"),
+    "checkedin": ("db_pool_checked_in", "gauge", "Idle connections in the pool"),
+    "overflow": ("db_pool_overflow", "gauge", "Connections opened beyond the pool size"),
+    "size": ("db_pool_size", "gauge", "Configured pool size"),
+    "waiting": ("db_pool_waiting", "gauge", "Requests waiting for a connection"),
+    "checkouts": ("db_pool_checkouts_total", "counter", "Connections handed out to requests"),
+    "timeouts": ("db_pool_checkout_timeouts_total", "counter", "Checkouts that gave up waiting"),
+    "wait_seconds_total": ("db_pool_checkout_wait_seconds_total", "counter", "Time spent waiting for connections"),
+}
+
+
+@metrics.collector
+def collect_service_metrics():
+    status = all_pools_status()
+    pools = [("primary", status["primary"])] + [(replica["url"], replica) for replica in status["replicas"]]
+    for counter, (name, kind, help) in pool_metrics.items():
+        yield name, kind, help, [({"pool": pool}, stats[counter]) for pool, stats in pools if counter in stats]
+
+    caches = {"catalog": catalog_cache.stats(), "tokens": security.token_cache.stats()}
+    yield "cache_hits_total", "counter", "Cache lookups that found an entry", \
+        [({"cache": cache}, stats["hits"]) for cache, stats in caches.items()]
+    yield "cache_misses_total", "counter", "Cache lookups that found nothing", \
+        [({"cache": cache}, stats["misses"]) for cache, stats in caches.items()]
+
+    yield "singleflight_calls_total", "counter", "Loads of a hot read run against the database", \
+        [({"read": read}, group.leaders) for read, group in flights.items()]
+    yield "singleflight_collapsed_total", "counter", "Requests served by a load another request started", \
+        [({"read": read}, group.collapsed) for read, group in flights.items()]
+
+    yield "app_startup_seconds", "gauge", "Time this worker spent starting, by phase", \
+        [({"phase": phase}, seconds) for phase, seconds in startup_seconds.items()]
+
+    bcrypt = hashing.stats()
+    yield "bcrypt_hash_seconds", "histogram", "Time spent hashing or verifying a password", \
+        [({}, hashing.hash_seconds)]
+    yield "bcrypt_in_flight", "gauge", "Hashes running or waiting for a worker", [({}, bcrypt["in_flight"])]
+    yield "bcrypt_rejected_total", "counter", "Hashes rejected with 503 because the pool was full", \
+        [({}, bcrypt["rejected"])]
+
+
 #####################################################################
 #                           static files                            #
 #####################################################################
@@ -0,0 +1,254 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from dotenv import load_dotenv, find_dotenv
+from sqlalchemy import event
+from starlette.routing import Match
+
+
+# loading environment variables from .env file
+load_dotenv(find_dotenv())
+
+# statements slower than this are logged with the shape of their parameters
+SQL_SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS", "200"))
+# an identical statement run this many times by one request is logged as a
+# suspected N+1 (a lazy load or a query in a loop)
+SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+# adds X-DB-Query-Count to every response, meant for development
+SQL_DEBUG_HEADER = os.environ.get("SQL_DEBUG_HEADER", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+
+# upper bounds (le) of the buckets of each histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        # observed from worker threads too (bcrypt)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield bound, total
+
+
+
+## Requests ##
+
+class RequestQueries:
+    """Statements run on behalf of the current request."""
+
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def repeated_statements(self):
+        return [
+            (statement, count) for statement, count in self.statements.items()
+            if count >= SQL_N_PLUS_ONE_THRESHOLD
+        ]
+
+
+current_queries: ContextVar[RequestQueries | None] = ContextVar("current_queries", default=None)
+
+request_seconds = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+request_queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+request_query_seconds = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+requests_in_flight = defaultdict(int)
+responses = defaultdict(int)
+suspected_n_plus_one = defaultdict(int)
+
+
+def route_template(scope):
+    # label requests by the route that serves them ("/products/{id}"), raw
+    # paths would give every product its own series
+    partial = None
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path or "/"
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path or "/"
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so that streamed responses aren't buffered and
+    the request's context (current_queries) is the one the endpoint sees."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["method"], route_template(scope))
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SQL_DEBUG_HEADER:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"x-db-query-count", str(queries.count).encode()),
+                    ]
+            await send(message)
+
+        queries = RequestQueries(*key)
+        token = current_queries.set(queries)
+        requests_in_flight[key] += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_seconds[key].observe(time.perf_counter() - start)
+            requests_in_flight[key] -= 1
+            responses[(*key, str(status_code))] += 1
+            request_queries[key].observe(queries.count)
+            request_query_seconds[key].observe(queries.seconds)
+            current_queries.reset(token)
+            report_repeated_statements(queries)
+
+
+def report_repeated_statements(queries: RequestQueries):
+    for statement, count in queries.repeated_statements():
+        suspected_n_plus_one[(queries.method, queries.route)] += 1
+        logger.warning(
+            "suspected N+1 in %s %s, statement ran %d times: %s",
+            queries.method, queries.route, count, statement
+        )
+
+
+
+## Database ##
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def parameter_shape(parameters, executemany: bool = False):
+    # types of the bind parameters, their values may be personal data
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} x {parameter_shape(rows[0])}" if rows else "[]"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    queries = current_queries.get()
+    if queries is not None:
+        queries.count += 1
+        queries.seconds += elapsed
+        queries.statements[statement] += 1
+
+    if elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        logger.warning(
+            "slow query (%.1f ms) in %s: %s parameters=%s",
+            elapsed * 1000,
+            f"{queries.method} {queries.route}" if queries is not None else "no request",
+            statement, parameter_shape(parameters, executemany)
+        )
+
+
+def instrument_engine(engine):
+    # async engines run their events on the wrapped sync engine, in the
+    # context of the task that awaited the query
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+
+## Exposition ##
+
+# functions returning (name, type, help, [(labels, value)]) for the state
+# other modules keep (pools, caches, ...); value is a Histogram for histograms
+collectors = []
+
+
+def collector(fn):
+    collectors.append(fn)
+    return fn
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _render(lines, name, kind, help, samples):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        if kind == "histogram":
+            for bound, count in value.cumulative():
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {value.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        else:
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+
+def _route_labels(key):
+    method, route = key
+    return {"method": method, "route": route}
+
+
+def render() -> str:
+    lines = []
+    _render(lines, "http_request_duration_seconds", "histogram", "Time spent serving requests",
+            [(_route_labels(key), value) for key, value in list(request_seconds.items())])
+    _render(lines, "http_requests_in_flight", "gauge", "Requests being served",
+            [(_route_labels(key), value) for key, value in list(requests_in_flight.items())])
+    _render(lines, "http_responses_total", "counter", "Responses sent, by status code",
+            [({**_route_labels((method, route)), "status": status}, value)
+             for (method, route, status), value in list(responses.items())])
+    _render(lines, "http_request_db_queries", "histogram", "Database statements run per request",
+            [(_route_labels(key), value) for key, value in list(request_queries.items())])
+    _render(lines, "http_request_db_seconds", "histogram", "Time spent in database statements per request",
+            [(_route_labels(key), value) for key, value in list(request_query_seconds.items())])
+    _render(lines, "http_suspected_n_plus_one_total", "counter",
+            f"Statements repeated at least {SQL_N_PLUS_ONE_THRESHOLD} times within a request",
+            [(_route_labels(key), value) for key, value in list(suspected_n_plus_one.items())])
+
+    for fn in collectors:
+        for name, kind, help, samples in fn():
+            _render(lines, name, kind, help, samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,127 @@
+import argparse
+import time
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table
+from sqlalchemy import func, inspect, select, text
+
+from database import engine
+import models
+
+
+# schema changes are applied by running this module before the app starts
+# (python migrate.py), the app itself never creates or alters tables
+
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", String(255), primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.current_timestamp(), nullable=False),
+)
+
+# arbitrary key of the advisory lock that keeps concurrent deploys from
+# migrating the same database at once
+MIGRATION_LOCK_KEY = 4242001
+
+
+def baseline(conn):
+    # tables created by the create_all main.py used to run at import; the
+    # ones missing are created from the models, existing ones are altered
+    # by the migrations below
+    models.Base.metadata.create_all(bind=conn)
+
+
+# (version, statements or function) in the order they are applied; every
+# statement is idempotent, databases that predate this module may have
+# some of them already
+MIGRATIONS = [
+    ("0001_baseline", baseline),
+    ("0002_products_seller_id_id", [
+        "CREATE INDEX IF NOT EXISTS ix_products_seller_id_id ON products (seller_id, id)",
+    ]),
+    ("0003_orders_placed_at", [
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS placed_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_orders_customer_id_placed_at ON orders (customer_id, placed_at)",
+        "CREATE INDEX IF NOT EXISTS ix_orders_seller_id_placed_at ON orders (seller_id, placed_at)",
+    ]),
+    ("0004_products_search", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', name), 'A') || setweight(to_tsvector('english', \"desc\"), 'B')"
+        ") STORED",
+        "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector)",
+        "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+    ]),
+    ("0005_orders_idempotency_key", [
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(255)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_orders_customer_id_idempotency_key "
+        "ON orders (customer_id, idempotency_key) WHERE idempotency_key IS NOT NULL",
+    ]),
+    ("0006_version_ids", [
+        "ALTER TABLE products ADD COLUMN IF NOT EXISTS version_id INTEGER DEFAULT 1 NOT NULL",
+        "ALTER TABLE images ADD COLUMN IF NOT EXISTS version_id INTEGER DEFAULT 1 NOT NULL",
+        "ALTER TABLE sellers ADD COLUMN IF NOT EXISTS version_id INTEGER DEFAULT 1 NOT NULL",
+    ]),
+]
+
+
+def apply(conn, migration):
+    if callable(migration):
+        migration(conn)
+    else:
+        for statement in migration:
+            conn.execute(text(statement))
+
+
+def applied_versions(conn):
+    return set(conn.execute(select(schema_migrations.c.version)).scalars().all())
+
+
+def migrate(bind=engine):
+    with bind.connect() as conn:
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            # held by the session, not a transaction, until unlocked below
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            with conn.begin():
+                schema_migrations.create(conn, checkfirst=True)
+                existing = set(inspect(conn).get_table_names()) & set(models.Base.metadata.tables)
+                applied = applied_versions(conn)
+
+                if not existing and not applied:
+                    # an empty database gets the current models in one go
+                    models.Base.metadata.create_all(bind=conn)
+                    conn.execute(schema_migrations.insert(), [{"version": version} for version, _ in MIGRATIONS])
+                    print(f"created schema at {MIGRATIONS[-1][0]}")
+                    return
+
+            for version, migration in MIGRATIONS:
+                if version in applied:
+                    continue
+
+                start = time.perf_counter()
+                with conn.begin():
+                    apply(conn, migration)
+                    conn.execute(schema_migrations.insert(), {"version": version})
+                print(f"applied {version} in {time.perf_counter() - start:.2f}s")
+        finally:
+            if is_postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def status(bind=engine):
+    with bind.connect() as conn:
+        applied = applied_versions(conn) if inspect(conn).has_table("schema_migrations") else set()
+    for version, _ in MIGRATIONS:
+        print(f"{'applied' if version in applied else 'pending':<8} {version}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="bring the database schema up to date")
+    parser.add_argument("--status", action="store_true", help="only list applied and pending migrations")
+    args = parser.parse_args()
+
+    if args.status:
+        status()
+    else:
+        migrate()
@@ -1,5 +1,9 @@
 from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, CheckConstraint, DATE
-from sqlalchemy import DECIMAL
+from sqlalchemy import Index
+from sqlalchemy import DECIMAL, DateTime
+from sqlalchemy import DDL, event, func, literal_column
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
 from sqlalchemy.orm import relationship
 from sqlalchemy import text
 from sqlalchemy.orm import Mapped
@@ -7,24 +11,61 @@ from sqlalchemy.orm import Mapped
 from database import Base
 
 
+# text search configuration of products.search_vector, queries against the
+# column have to use the same one for the GIN index to apply
+SEARCH_CONFIG = "english"
+
 
 class Product(Base):
     __tablename__ = "products"
     __table_args__ = (
         CheckConstraint('id >= 0'),
         CheckConstraint('price >= 0'),
+        # keyset pagination of a seller's catalog: WHERE seller_id = ? AND id > ? ORDER BY id
+        Index('ix_products_seller_id_id', 'seller_id', 'id'),
     )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
     price = Column(DECIMAL(10,2), nullable=False)
     desc = Column(String(500), server_default="", nullable=False)
+    # bumped on every change to the product or its images, the ETag of
+    # GET /products/{id} is derived from it
+    version_id = Column(Integer, server_default="1", nullable=False)
 
     # foreign key from seller
     seller_id = Column(Integer, ForeignKey('sellers.id', ondelete='CASCADE'), nullable=False)
     #foreign key on images
     imgs = relationship('Image')
 
+    __mapper_args__ = {
+        # fetch server defaults at INSERT, they can't be lazy loaded by AsyncSession
+        "eager_defaults": True,
+        "version_id_col": version_id,
+    }
+
+
+# full text and typo tolerant search only exist on postgres; the generated
+# column and its indexes are created there only, so that the schema still
+# builds on SQLite (development, tests), where search isn't available.
+# products.search_vector is maintained by postgres and only used to filter /
+# rank searches, it isn't mapped
+product_search_vector = literal_column("products.search_vector", TSVECTOR)
+
+for statement in (
+    # gin_trgm_ops of ix_products_name_trgm comes from the pg_trgm extension
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE products ADD COLUMN search_vector TSVECTOR GENERATED ALWAYS AS ("
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', name), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', \"desc\"), 'B')"
+    ") STORED",
+    # full text search: WHERE search_vector @@ query
+    "CREATE INDEX ix_products_search_vector ON products USING gin (search_vector)",
+    # typo tolerant fallback: WHERE name % ?
+    "CREATE INDEX ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+):
+    event.listen(Product.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
 
 class Image(Base):
     __tablename__ = "images"
@@ -36,6 +77,9 @@ class Image(Base):
     # foreign key from product.id
     product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
 
+    version_id = Column(Integer, server_default="1", nullable=False)
+    __mapper_args__ = {"eager_defaults": True, "version_id_col": version_id}
+
 
 class Account(Base):
     __tablename__ = "bank_accounts"
@@ -72,9 +116,17 @@ class Card(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __mapper_args__ = {"eager_defaults": True}
     __table_args__ = (
         CheckConstraint('id >= 0'),
         CheckConstraint('price >= 0'),
+        # date range listing of a customer's / seller's orders
+        Index('ix_orders_customer_id_placed_at', 'customer_id', 'placed_at'),
+        Index('ix_orders_seller_id_placed_at', 'seller_id', 'placed_at'),
+        # a retried POST /orders/place carries the same Idempotency-Key
+        Index('ux_orders_customer_id_idempotency_key', 'customer_id', 'idempotency_key', unique=True,
+              postgresql_where=text('idempotency_key IS NOT NULL'),
+              sqlite_where=text('idempotency_key IS NOT NULL')),
     )
 
     id = Column(Integer, primary_key=True)
@@ -83,6 +135,14 @@ class Order(Base):
     is_cancled = Column(Boolean, nullable = False, server_default="FALSE")
     is_delivered = Column(Boolean, nullable = False, server_default="FALSE")
     status = Column(String(255), nullable=True)
+    # sqlite stores the default (CURRENT_TIMESTAMP) as text without
+    # microseconds, bound values have to match it for order cursors to
+    # compare against it
+    placed_at = Column(
+        DateTime(timezone=True).with_variant(SQLITE_DATETIME(truncate_microseconds=True), "sqlite"),
+        server_default=func.now(), nullable=False
+    )
+    idempotency_key = Column(String(255), nullable=True)
 
     # foreign key from customer from customer, seller, products
     seller_id = Column(Integer, ForeignKey('sellers.id', ondelete='CASCADE'), nullable=False)
@@ -93,6 +153,7 @@ class Order(Base):
 
 class Customer(Base):
     __tablename__ = "customers"
+    __mapper_args__ = {"eager_defaults": True}
     __table_args__ = (
         CheckConstraint('age >= 10'),
         CheckConstraint('age <= 200'),
@@ -102,7 +163,7 @@ class Customer(Base):
     name = Column(String(255), nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     age = Column(Integer, nullable=True)
-    joined_on = Column(DATE, server_default=text('now()'), nullable = True)
+    joined_on = Column(DATE, server_default=func.current_date(), nullable = True)
     hashed_password = Column(String, nullable=False)
     # TODO: profile picture
     # foreign key on cards
@@ -118,8 +179,10 @@ class Seller(Base):
     name = Column(String(255), nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     age = Column(Integer, nullable=True)
-    joined_on = Column(DATE, server_default=text('now()'), nullable = True)
+    joined_on = Column(DATE, server_default=func.current_date(), nullable = True)
     hashed_password = Column(String, nullable=False)
+    # bumped on every change to the seller or its catalog
+    version_id = Column(Integer, server_default="1", nullable=False)
     
     # foreign key on products
     products = relationship('Product')
@@ -128,5 +191,7 @@ class Seller(Base):
     # foreign key on order
     orders = relationship('Order')
 
+    __mapper_args__ = {"eager_defaults": True, "version_id_col": version_id}
+
 
 
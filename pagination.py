@@ -0,0 +1,23 @@
+import base64
+import json
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(**keys) -> str:
+    raw = json.dumps(keys, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *fields: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        keys = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(keys, dict) or set(keys) != set(fields):
+            raise ValueError(cursor)
+        return keys
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
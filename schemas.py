@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 
 from pydantic import BaseModel
 from pydantic import Field
@@ -97,6 +97,40 @@ class ProductDB(ProductOut):
     pass
 
 
+class ProductImageIn(BaseModel):
+    img: HttpUrl
+    desc: str = Field(default="", max_length=255)
+
+
+class ProductBulkIn(ProductIn):
+    imgs: list[ProductImageIn] = Field(default=[], max_items=10)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "name": "some very cool product",
+                "price": 100.01,
+                "desc": "freshly prepared from very cool ingredients",
+                "imgs": [
+                    {
+                        "img": "https://example.com/foo.jpg",
+                        "desc": "foo",
+                    },
+                ],
+            }
+        }
+
+
+class BulkRowError(BaseModel):
+    index: int
+    errors: list[dict]
+
+
+class ProductBulkOut(BaseModel):
+    created: list[ProductOut] = []
+    errors: list[BulkRowError] = []
+
+
 
 
 # TODO: implement in future
@@ -321,6 +355,7 @@ class OrderIn(OrderBase):
 
 class OrderOut(OrderIn):
     id: int = Field(ge=0)
+    placed_at: datetime | None = None
     class Config:
         orm_mode = True
         schema_extra = {
@@ -335,6 +370,7 @@ class OrderOut(OrderIn):
                 "customer_id": 1002,
                 "seller_id": 1003,
                 "product_id": 1001,
+                "placed_at": "2022-12-24T10:30:00+00:00",
             }
         }
 
@@ -350,7 +386,11 @@ class SellerIn(UserBase):
 
 class SellerOut(SellerIn):
     id: int = Field(ge=0)
+    # the whole catalog of a seller can be huge, only its size and first
+    # page are embedded; products_next links to the following page
+    product_count: int = 0
     products: list[ProductOut] = []
+    products_next: str | None = None
 
     class Config:
         orm_mode = True
@@ -360,7 +400,9 @@ class SellerOut(SellerIn):
                 "name": "Foo Bar",
                 "email": "foo.bar@example.com",
                 "joined_on": "2003-04-12",
-                "products": []
+                "product_count": 25,
+                "products": [],
+                "products_next": "/products/seller/1002?limit=10&after=eyJzZWxsZXJfaWQiOjEwMDIsImlkIjoxMDEwfQ"
             }
         }
 
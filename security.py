@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+import hashlib
 import os
 
 from dotenv import load_dotenv, find_dotenv
@@ -8,9 +9,11 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache import LRUCache
 from database import get_db
+from hashing import run_in_hash_pool, BCRYPT_ROUNDS
 import models, schemas
 from schemas import Token, TokenData
 
@@ -23,16 +26,20 @@ load_dotenv(find_dotenv())
 SECRET_KEY = os.environ.get("SECRET_KEY", "FAKE_SECRET_KEY")
 ALGORITHM = os.environ.get("ALGORITHM", "MD5")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
 
 
 
 router = APIRouter()
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+# already verified tokens, keyed by their sha256 digest and evicted at their exp
+token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+
 
 
 credentials_exception = HTTPException(
@@ -62,21 +69,29 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 
 
-def authenticate_user(email: EmailStr, password: str, db: Session, seller: bool = False):
+async def authenticate_user(email: EmailStr, password: str, db: AsyncSession, seller: bool = False):
     import crud
     
     if (seller):
-        user = crud.get_seller_by_email(db=db, email=email)
+        user = await crud.get_seller_by_email(db=db, email=email)
     else:
-        user = crud.get_customer_by_email(db=db, email=email)
+        user = await crud.get_customer_by_email(db=db, email=email)
     
-    if user and verify_password(password, user.hashed_password):
+    # nothing else of a login needs the session: its connection goes back
+    # to the pool instead of being held while bcrypt runs
+    await db.close()
+    if user and await run_in_hash_pool(verify_password, password, user.hashed_password):
         return user
     else:
         raise credentials_exception
     
     
-def decode_access_token_if_valid_else_throw_401(token: str = Depends(oauth2_scheme)):
+async def decode_access_token_if_valid_else_throw_401(token: str = Depends(oauth2_scheme)):
+    token_digest = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(token_digest)
+    if token_data:
+        return token_data
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -86,6 +101,8 @@ def decode_access_token_if_valid_else_throw_401(token: str = Depends(oauth2_sche
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         if payload:
             token_data = TokenData(**payload)
+            if "exp" in payload:
+                token_cache.set(token_digest, token_data, expires_at=payload["exp"])
             return token_data
         else:
             raise credentials_exception
@@ -95,9 +112,9 @@ def decode_access_token_if_valid_else_throw_401(token: str = Depends(oauth2_sche
     
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db), seller: bool = Query(default=False)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db), seller: bool = Query(default=False)):
     user_email = EmailStr(form_data.username)
-    user = authenticate_user(user_email, form_data.password, db=db, seller=seller)
+    user = await authenticate_user(user_email, form_data.password, db=db, seller=seller)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
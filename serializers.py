@@ -0,0 +1,70 @@
+from functools import lru_cache
+
+import orjson
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST
+
+
+# Response models are only used to describe the API for list endpoints: ORM
+# rows are turned straight into JSON bytes instead of being validated into
+# a schema and then run through jsonable_encoder. What a schema needs from
+# a row is worked out once, a "plan" of (field, conversion) pairs; with a
+# sparse fieldset (?fields=) the plan only has the fields asked for.
+
+
+def _as_float(value):
+    # DECIMAL columns come back as Decimal, which orjson doesn't serialize
+    return None if value is None else float(value)
+
+
+def _nested(to_dict):
+    def convert(value):
+        return None if value is None else to_dict(value)
+    return convert
+
+
+def _nested_list(to_dict):
+    def convert(values):
+        return [to_dict(value) for value in values]
+    return convert
+
+
+@lru_cache(maxsize=None)
+def field_plan(schema: type[BaseModel], fields: frozenset[str] | None = None):
+    plan = []
+    for name, field in schema.__fields__.items():
+        if fields is not None and name not in fields:
+            continue
+        field_type = field.type_ if isinstance(field.type_, type) else object
+        if issubclass(field_type, BaseModel):
+            nested = row_to_dict(field_type)
+            convert = _nested_list(nested) if field.shape == SHAPE_LIST else _nested(nested)
+        elif issubclass(field_type, float):
+            # constrained floats (Field(gt=...)) are subclasses of float
+            convert = _as_float
+        else:
+            # str, int, bool, date and datetime are serialized by orjson as is
+            convert = None
+        plan.append((name, convert))
+    return tuple(plan)
+
+
+@lru_cache(maxsize=None)
+def row_to_dict(schema: type[BaseModel], fields: frozenset[str] | None = None):
+    plan = field_plan(schema, fields)
+
+    def to_dict(row):
+        return {
+            name: getattr(row, name) if convert is None else convert(getattr(row, name))
+            for name, convert in plan
+        }
+    return to_dict
+
+
+def dump(schema: type[BaseModel], row, fields: frozenset[str] | None = None) -> bytes:
+    return orjson.dumps(row_to_dict(schema, fields)(row))
+
+
+def dumps(schema: type[BaseModel], rows, fields: frozenset[str] | None = None) -> bytes:
+    to_dict = row_to_dict(schema, fields)
+    return orjson.dumps([to_dict(row) for row in rows])
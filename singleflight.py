@@ -0,0 +1,34 @@
+import asyncio
+
+
+class Group:
+    """Runs one call per key at a time: callers that ask for a key already
+    being loaded wait for that call and share its result (or exception)
+    instead of issuing the same query again.
+
+    The call runs as a task of its own, a leader whose request is cancelled
+    (the client went away) doesn't cancel it for the callers sharing it.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        # calls run, and callers served by another caller's call
+        self.leaders = 0
+        self.collapsed = 0
+
+    async def do(self, key, fn, *args):
+        task = self.calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = self.calls[key] = asyncio.create_task(fn(*args))
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "in_flight": len(self.calls),
+            "leaders": self.leaders,
+            "collapsed": self.collapsed,
+        }
@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+
+
+# database reads its settings at import: the tests point the app at SQLite
+# files of their own (a primary and a replica) before anything imports it
+DATABASE_DIR = Path(tempfile.mkdtemp(prefix="cymbol-tests-"))
+PRIMARY_URL = f"sqlite:///{DATABASE_DIR / 'primary.db'}"
+REPLICA_URL = f"sqlite:///{DATABASE_DIR / 'replica.db'}"
+
+os.environ["SQLALCHEMY_DATABASE_URL"] = PRIMARY_URL
+os.environ["SQLALCHEMY_REPLICA_URLS"] = ""
+os.environ.setdefault("SECRET_KEY", "tests")
+os.environ.setdefault("ALGORITHM", "HS256")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import catalog_cache, migrate, models
+from cache import MemoryBackend
+
+
+@pytest.fixture(scope="session")
+def primary_engine():
+    engine = create_engine(PRIMARY_URL)
+    migrate.migrate(engine)
+    return engine
+
+
+@pytest.fixture(scope="session")
+def replica_engine():
+    engine = create_engine(REPLICA_URL)
+    migrate.migrate(engine)
+    return engine
+
+
+@pytest.fixture
+def client(primary_engine):
+    from fastapi.testclient import TestClient
+    import main
+
+    # every test starts from a cold cache, so that reads reach the database
+    catalog_cache.use_backend(MemoryBackend(maxsize=catalog_cache.CATALOG_CACHE_SIZE))
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def use_replicas(monkeypatch):
+    import database
+
+    def use(*replicas):
+        monkeypatch.setattr(database, "replicas", list(replicas))
+    return use
+
+
+def insert_seller(engine, email: str, products: int = 0, images: int = 0):
+    # rows are inserted directly, going through the API would bcrypt a
+    # password per seller
+    with engine.begin() as conn:
+        seller_id = conn.execute(models.Seller.__table__.insert().values(
+            name="test seller", email=email, hashed_password="not a hash"
+        )).inserted_primary_key[0]
+        for i in range(products):
+            product_id = conn.execute(models.Product.__table__.insert().values(
+                name=f"test product {i}", price=10, desc="", seller_id=seller_id
+            )).inserted_primary_key[0]
+            for image in range(images):
+                conn.execute(models.Image.__table__.insert().values(
+                    img=f"https://example.com/{product_id}/{image}.jpg", desc="", product_id=product_id
+                ))
+    return seller_id
+
+
+@pytest.fixture(scope="session")
+def seed_seller():
+    return insert_seller
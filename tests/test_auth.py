@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import event
+
+import crud, database, main, security
+
+
+@pytest.fixture
+def connections_held_while_hashing(monkeypatch):
+    # connections checked out of the request engine when each hash runs
+    held, counts = [0], []
+    pool = database.async_engine.sync_engine.pool
+    on_checkout = lambda *args: held.__setitem__(0, held[0] + 1)
+    on_checkin = lambda *args: held.__setitem__(0, held[0] - 1)
+    event.listen(pool, "checkout", on_checkout)
+    event.listen(pool, "checkin", on_checkin)
+
+    def counting(run_in_hash_pool):
+        async def run(fn, *args):
+            counts.append(held[0])
+            return await run_in_hash_pool(fn, *args)
+        return run
+
+    monkeypatch.setattr(security, "run_in_hash_pool", counting(security.run_in_hash_pool))
+    monkeypatch.setattr(crud, "run_in_hash_pool", counting(crud.run_in_hash_pool))
+    yield counts
+    event.remove(pool, "checkout", on_checkout)
+    event.remove(pool, "checkin", on_checkin)
+
+
+def test_sign_up_and_login_hash_without_a_connection(client, connections_held_while_hashing):
+    response = client.post("/customers/create", json={"name": "hashing", "email": "hashing@example.com"})
+    assert response.status_code == 200
+
+    response = client.post(
+        "/auth/token", data={"username": "hashing@example.com", "password": "fakepassword@hashing@example.com"}
+    )
+    assert response.status_code == 200
+    assert connections_held_while_hashing == [0, 0]
+
+
+@pytest.mark.parametrize("token, authorization, status_code", [
+    ("", "Bearer ", 404),
+    ("internal", None, 401),
+    ("internal", "Bearer wrong", 401),
+    ("internal", "Bearer internal", 200),
+])
+def test_internal_endpoints_need_the_internal_token(client, monkeypatch, token, authorization, status_code):
+    monkeypatch.setattr(main, "INTERNAL_TOKEN", token)
+    headers = {"Authorization": authorization} if authorization else {}
+    for path in ("/internal/db/pool", "/internal/cache"):
+        assert client.get(path, headers=headers).status_code == status_code
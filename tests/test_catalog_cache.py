@@ -0,0 +1,72 @@
+from sqlalchemy import select
+
+import catalog_cache, database, models, security
+from pagination import encode_cursor
+
+
+def copy_rows(source, target, model, id):
+    # the replica as it was before a write to the primary reached it
+    table = model.__table__
+    with source.connect() as conn:
+        row = conn.execute(select(table).where(table.c.id == id)).mappings().first()
+    with target.begin() as conn:
+        conn.execute(table.delete().where(table.c.id == id))
+        conn.execute(table.insert().values(**row))
+
+
+def update_behind_replica(client, primary_engine, replica_engine, seed_seller, email):
+    # a product renamed on the primary, the replica still has the old name
+    seller_id = seed_seller(primary_engine, email, products=1)
+    with primary_engine.connect() as conn:
+        product_id = conn.execute(
+            select(models.Product.id).where(models.Product.seller_id == seller_id)
+        ).scalar()
+    copy_rows(primary_engine, replica_engine, models.Seller, seller_id)
+    copy_rows(primary_engine, replica_engine, models.Product, product_id)
+
+    token = security.create_access_token({"sub": email, "id": seller_id, "seller": True})
+    response = client.put(
+        f"/products/{product_id}/update",
+        json={"name": "renamed", "price": 10, "desc": ""},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    return seller_id, product_id
+
+
+def test_stale_replica_read_is_not_cached(client, primary_engine, replica_engine, use_replicas, seed_seller):
+    _, product_id = update_behind_replica(
+        client, primary_engine, replica_engine, seed_seller, "stale-replica@example.com"
+    )
+
+    # the lagging replica still has the old product: served, not cached
+    use_replicas(database.Replica(str(replica_engine.url)))
+    response = client.get(f"/products/{product_id}")
+    assert response.json()["name"] == "test product 0"
+    assert catalog_cache.get(catalog_cache.product_key(product_id)) is None
+
+    # once a read sees the write it is cached again
+    use_replicas()
+    response = client.get(f"/products/{product_id}")
+    assert response.json()["name"] == "renamed"
+    assert catalog_cache.get(catalog_cache.product_key(product_id)) is not None
+
+
+def test_listings_are_read_from_the_primary_after_a_write(
+    client, primary_engine, replica_engine, use_replicas, seed_seller
+):
+    seller_id, product_id = update_behind_replica(
+        client, primary_engine, replica_engine, seed_seller, "stale-listing@example.com"
+    )
+    use_replicas(database.Replica(str(replica_engine.url)))
+
+    listings = [
+        ("/products", {"limit": 1, "after": encode_cursor(id=product_id - 1)}),
+        (f"/products/seller/{seller_id}", {}),
+    ]
+    for path, params in listings:
+        # read from the primary, and cached as such
+        assert client.get(path, params=params).json()[0]["name"] == "renamed"
+        use_replicas()
+        assert client.get(path, params=params).json()[0]["name"] == "renamed"
+        use_replicas(database.Replica(str(replica_engine.url)))
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import crud, database, models, security
+
+
+@pytest.fixture
+def catalog(request, primary_engine, seed_seller):
+    email = f"{request.node.name}@example.com"
+    seller_id = seed_seller(primary_engine, email, products=1, images=1)
+    with primary_engine.connect() as conn:
+        product_id, image_id = conn.execute(
+            select(models.Product.id, models.Image.id).join(models.Image)
+            .where(models.Product.seller_id == seller_id)
+        ).first()
+    token = security.create_access_token({"sub": email, "id": seller_id, "seller": True})
+    return seller_id, product_id, image_id, {"Authorization": f"Bearer {token}"}
+
+
+def current_etag(client, path):
+    # the ETag of path, which a conditional GET revalidates with a 304
+    etag = client.get(path).headers["etag"]
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    return etag
+
+
+def assert_changed(client, path, etag):
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def update_image(primary_engine, image_id, **details):
+    # image updates have no endpoint, crud is called on an engine of its own
+    async def update():
+        engine = create_async_engine(database.to_async_url(str(primary_engine.url)))
+        async with database.async_sessionmaker(engine)() as db:
+            image = await crud.update_image(db, image_id, **details)
+        await engine.dispose()
+        return image
+    return asyncio.run(update())
+
+
+def test_product_update(client, catalog):
+    seller_id, product_id, _, headers = catalog
+    product, seller = f"/products/{product_id}", f"/sellers/id/{seller_id}"
+    etags = {path: current_etag(client, path) for path in (product, seller)}
+
+    response = client.put(
+        f"/products/{product_id}/update", json={"name": "etag product", "price": 3, "desc": ""}, headers=headers
+    )
+    assert response.status_code == 200
+    for path, etag in etags.items():
+        assert_changed(client, path, etag)
+
+
+def test_image_add(client, catalog):
+    seller_id, product_id, _, headers = catalog
+    product, seller = f"/products/{product_id}", f"/sellers/id/{seller_id}"
+    etags = {path: current_etag(client, path) for path in (product, seller)}
+
+    response = client.post(
+        f"/products/{product_id}/addImage",
+        json={"img": f"https://example.com/etags/{product_id}.jpg", "product_id": product_id},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    for path, etag in etags.items():
+        assert_changed(client, path, etag)
+
+
+def test_image_update(client, primary_engine, catalog):
+    _, product_id, image_id, _ = catalog
+    paths = (f"/images/{image_id}", f"/products/{product_id}")
+    etags = {path: current_etag(client, path) for path in paths}
+
+    assert update_image(primary_engine, image_id, desc="updated") is not None
+    for path, etag in etags.items():
+        assert_changed(client, path, etag)
+
+
+def test_new_product_changes_the_seller_profile(client, catalog):
+    seller_id, _, _, headers = catalog
+    seller = f"/sellers/id/{seller_id}"
+    etag = current_etag(client, seller)
+
+    response = client.post("/products/create", json={"name": "another product", "price": 4}, headers=headers)
+    assert response.status_code == 200
+    assert_changed(client, seller, etag)
+    assert client.get(seller).json()["product_count"] == 2
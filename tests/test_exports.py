@@ -0,0 +1,63 @@
+import csv
+import io
+
+import orjson
+import pytest
+from sqlalchemy import select
+
+import exports, models, security
+
+
+@pytest.fixture(scope="module")
+def seller(primary_engine, seed_seller):
+    # a seller with two orders of one of its products
+    seller_id = seed_seller(primary_engine, "exports@example.com", products=1)
+    with primary_engine.begin() as conn:
+        product_id = conn.execute(
+            select(models.Product.id).where(models.Product.seller_id == seller_id)
+        ).scalar()
+        customer_id = conn.execute(models.Customer.__table__.insert().values(
+            name="exports customer", email="exports-customer@example.com", hashed_password="not a hash"
+        )).inserted_primary_key[0]
+        conn.execute(models.Order.__table__.insert(), [
+            {"price": price, "customer_id": customer_id, "seller_id": seller_id, "product_id": product_id}
+            for price in (3, 4)
+        ])
+    return seller_headers(seller_id, "exports@example.com")
+
+
+def seller_headers(seller_id, email):
+    token = security.create_access_token({"sub": email, "id": seller_id, "seller": True})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def export(client, headers, export_format):
+    response = client.get("/sellers/me/orders/export", params={"format": export_format}, headers=headers)
+    assert response.status_code == 200
+    return response.text
+
+
+def test_ndjson_export_matches_the_api(client, seller):
+    orders = client.get("/sellers/me/orders/all", headers=seller).json()
+    lines = export(client, seller, "ndjson").splitlines()
+    assert [orjson.loads(line) for line in lines] == orders
+    assert b'"price":3.0' in lines[0].encode()
+
+
+def test_csv_export_matches_the_api(client, seller):
+    orders = client.get("/sellers/me/orders/all", headers=seller).json()
+    rows = list(csv.reader(io.StringIO(export(client, seller, "csv"))))
+    assert rows[0] == exports.ORDER_FIELDS
+    assert rows[1:] == [
+        ["" if value is None else str(value).lower() if isinstance(value, bool) else str(value)
+         for value in order.values()]
+        for order in orders
+    ]
+    assert rows[1][rows[0].index("price")] == "3.0"
+    assert rows[1][rows[0].index("is_cod")] == "true"
+
+
+def test_export_of_a_seller_without_orders(client, primary_engine, seed_seller):
+    headers = seller_headers(seed_seller(primary_engine, "exports-none@example.com"), "exports-none@example.com")
+    assert export(client, headers, "ndjson") == ""
+    assert list(csv.reader(io.StringIO(export(client, headers, "csv")))) == [exports.ORDER_FIELDS]
@@ -0,0 +1,37 @@
+import asyncio
+
+import loaders
+
+
+class Session:
+    # stands in for an AsyncSession, loaders only use its info dict
+    def __init__(self):
+        self.info = {}
+
+
+running = []
+
+
+async def fetch(db, keys):
+    running.append(len(running) + 1)
+    await asyncio.sleep(0.01)
+    concurrent = running.pop()
+    return {key: (key, concurrent) for key in keys}
+
+
+async def fetch_other(db, keys):
+    return await fetch(db, keys)
+
+
+def test_loaders_of_a_session_dispatch_one_at_a_time():
+    async def load():
+        db = Session()
+        return await asyncio.gather(
+            loaders.loader(db, fetch).load_many([1, 2]),
+            loaders.loader(db, fetch_other).load_many([3]),
+        )
+
+    first, second = asyncio.run(load())
+    # one batch per loader, neither ran alongside the other
+    assert first == [(1, 1), (2, 1)]
+    assert second == [(3, 1)]
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+import models, security
+
+
+@pytest.fixture(scope="module")
+def customer(primary_engine):
+    with primary_engine.begin() as conn:
+        customer_id = conn.execute(models.Customer.__table__.insert().values(
+            name="test customer", email="orders@example.com", hashed_password="not a hash"
+        )).inserted_primary_key[0]
+    token = security.create_access_token({"sub": "orders@example.com", "id": customer_id, "seller": False})
+    return customer_id, {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="module")
+def product(primary_engine, seed_seller):
+    seller_id = seed_seller(primary_engine, "orders-seller@example.com", products=1)
+    with primary_engine.connect() as conn:
+        product_id = conn.execute(
+            select(models.Product.id).where(models.Product.seller_id == seller_id)
+        ).scalar()
+    return seller_id, product_id
+
+
+def new_order(customer_id, seller_id, product_id, price=10):
+    return {"price": price, "customer_id": customer_id, "seller_id": seller_id, "product_id": product_id}
+
+
+def test_retry_returns_the_first_order(client, customer, product):
+    customer_id, headers = customer
+    headers = {**headers, "Idempotency-Key": "retry"}
+    order = new_order(customer_id, *product)
+
+    first = client.post("/orders/place", json=order, headers=headers)
+    retry = client.post("/orders/place", json=order, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+
+
+def test_key_reused_for_another_order_is_rejected(client, customer, product):
+    customer_id, headers = customer
+    headers = {**headers, "Idempotency-Key": "reused"}
+
+    first = client.post("/orders/place", json=new_order(customer_id, *product), headers=headers)
+    other = client.post("/orders/place", json=new_order(customer_id, *product, price=20), headers=headers)
+    assert first.status_code == 200
+    assert other.status_code == 422
+
+
+def test_order_of_another_customer_is_forbidden(client, customer, product):
+    customer_id, headers = customer
+    response = client.post("/orders/place", json=new_order(customer_id + 1, *product), headers=headers)
+    assert response.status_code == 403
+
+
+def test_orders_placed_in_the_same_second_are_paged_through(client, customer, product):
+    customer_id, headers = customer
+    for _ in range(3):
+        assert client.post("/orders/place", json=new_order(customer_id, *product), headers=headers).status_code == 200
+    today = datetime.now(timezone.utc).date()
+
+    paged, after = [], None
+    while True:
+        params = {"start": today, "end": today, "limit": 2, **({"after": after} if after else {})}
+        response = client.get("/customers/me/orders", params=params, headers=headers)
+        if response.status_code == 404:
+            break
+        paged += [order["id"] for order in response.json()]
+        after = response.headers.get("x-next-cursor")
+        if after is None:
+            break
+
+    every = [order["id"] for order in client.get("/customers/me/orders/all", headers=headers).json()]
+    assert paged == sorted(every)
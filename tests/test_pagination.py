@@ -0,0 +1,24 @@
+import pytest
+
+from pagination import encode_cursor
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode_cursor(id="x"),
+    encode_cursor(id=None),
+    encode_cursor(other=1),
+])
+def test_bad_product_cursor_is_rejected(client, cursor):
+    response = client.get("/products", params={"after": cursor})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", [
+    encode_cursor(seller_id=1, id="x"),
+    encode_cursor(seller_id="x", id=1),
+    encode_cursor(seller_id=2, id=1),
+])
+def test_bad_seller_products_cursor_is_rejected(client, cursor):
+    response = client.get("/products/seller/1", params={"after": cursor})
+    assert response.status_code == 400
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import exc, select
+
+import crud, models, security
+
+
+@pytest.fixture(scope="module")
+def product(primary_engine, seed_seller):
+    seller_id = seed_seller(primary_engine, "update-owner@example.com", products=1)
+    with primary_engine.connect() as conn:
+        product_id = conn.execute(
+            select(models.Product.id).where(models.Product.seller_id == seller_id)
+        ).scalar()
+    return seller_id, product_id
+
+
+def seller_headers(seller_id, email):
+    token = security.create_access_token({"sub": email, "id": seller_id, "seller": True})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_update_of_own_product(client, product):
+    seller_id, product_id = product
+    response = client.put(
+        f"/products/{product_id}/update",
+        json={"name": "updated by owner", "price": 5, "desc": ""},
+        headers=seller_headers(seller_id, "update-owner@example.com"),
+    )
+    assert response.status_code == 200
+    assert response.json()["name"] == "updated by owner"
+
+
+def test_update_of_another_sellers_product_is_refused(client, primary_engine, seed_seller, product):
+    _, product_id = product
+    other_id = seed_seller(primary_engine, "update-other@example.com")
+    response = client.put(
+        f"/products/{product_id}/update",
+        json={"name": "updated by another", "price": 5, "desc": ""},
+        headers=seller_headers(other_id, "update-other@example.com"),
+    )
+    assert response.status_code == 405
+    assert client.get(f"/products/{product_id}").json()["name"] != "updated by another"
+
+
+def test_update_of_missing_product(client, product):
+    seller_id, _ = product
+    response = client.put(
+        "/products/999999/update",
+        json={"name": "updated nothing", "price": 5, "desc": ""},
+        headers=seller_headers(seller_id, "update-owner@example.com"),
+    )
+    assert response.status_code == 404
+
+
+def test_bulk_create(client, primary_engine, seed_seller):
+    seller_id = seed_seller(primary_engine, "bulk@example.com")
+    other_id = seed_seller(primary_engine, "bulk-other@example.com", products=1, images=1)
+    with primary_engine.connect() as conn:
+        taken = conn.execute(
+            select(models.Image.img).join(models.Product).where(models.Product.seller_id == other_id)
+        ).scalar()
+
+    rows = [
+        {"name": "bulk product 0", "price": 1, "imgs": [
+            {"img": "https://example.com/bulk/0.jpg"}, {"img": "https://example.com/bulk/1.jpg"},
+        ]},
+        # fails validation
+        {"name": "x", "price": 1},
+        # an image url another product has
+        {"name": "bulk product 2", "price": 1, "imgs": [{"img": taken}]},
+        # the same image url twice
+        {"name": "bulk product 3", "price": 1, "imgs": [
+            {"img": "https://example.com/bulk/3.jpg"}, {"img": "https://example.com/bulk/3.jpg"},
+        ]},
+        {"name": "bulk product 4", "price": 2},
+    ]
+    response = client.post("/products/bulk", json=rows, headers=seller_headers(seller_id, "bulk@example.com"))
+    assert response.status_code == 200
+
+    body = response.json()
+    assert [error["index"] for error in body["errors"]] == [1, 2, 3]
+    assert body["errors"][0]["errors"][0]["loc"] == ["name"]
+    assert body["errors"][1]["errors"][0]["msg"] == f"image url already in use: {taken}"
+    assert body["errors"][2]["errors"][0]["msg"] == "image url already in use: https://example.com/bulk/3.jpg"
+
+    created = body["created"]
+    assert [product["name"] for product in created] == ["bulk product 0", "bulk product 4"]
+    # every product and image is returned as stored
+    for product in created:
+        assert client.get(f"/products/{product['id']}").json() == product
+    assert [image["img"] for image in created[0]["imgs"]] == [
+        "https://example.com/bulk/0.jpg", "https://example.com/bulk/1.jpg",
+    ]
+    assert created[1]["imgs"] == []
+
+
+@pytest.mark.parametrize("error, raised", [
+    (exc.CompileError("Unconsumed column names: nope"), HTTPException),
+    (exc.ArgumentError("bad key"), HTTPException),
+    (asyncio.CancelledError(), asyncio.CancelledError),
+    (HTTPException(status_code=503, detail="Database is busy, try again shortly"), HTTPException),
+])
+def test_update_image_only_reports_invalid_fields(monkeypatch, error, raised):
+    async def update_returning(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(crud, "_update_returning", update_returning)
+
+    with pytest.raises(raised) as caught:
+        asyncio.run(crud.update_image(None, 1, nope=1))
+    if raised is HTTPException:
+        expected = 503 if isinstance(error, HTTPException) else 422
+        assert caught.value.status_code == expected
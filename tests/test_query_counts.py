@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import database
+
+
+# statements each endpoint may run, however many products / images it
+# returns; a lazy load per row (an N+1) breaks these
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = database.async_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture(scope="module")
+def seller_id(primary_engine, seed_seller):
+    return seed_seller(primary_engine, "query-counts@example.com", products=12, images=3)
+
+
+@pytest.mark.parametrize("limit", [1, 10])
+def test_product_list(client, seller_id, limit):
+    with count_queries() as statements:
+        response = client.get("/products", params={"limit": limit})
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+    # the page, its images
+    assert len(statements) == 2
+
+
+@pytest.mark.parametrize("limit", [1, 10])
+def test_seller_product_list(client, seller_id, limit):
+    with count_queries() as statements:
+        response = client.get(f"/products/seller/{seller_id}", params={"limit": limit})
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+    # the page, its images
+    assert len(statements) == 2
+
+
+def test_product_by_id(client, seller_id):
+    product_id = client.get(f"/products/seller/{seller_id}", params={"limit": 1}).json()[0]["id"]
+    with count_queries() as statements:
+        response = client.get(f"/products/{product_id}")
+    assert response.status_code == 200
+    assert len(response.json()["imgs"]) == 3
+    # the product, its images
+    assert len(statements) == 2
+
+
+def test_seller_profile(client, seller_id):
+    with count_queries() as statements:
+        response = client.get(f"/sellers/id/{seller_id}")
+    assert response.status_code == 200
+    assert response.json()["product_count"] == 12
+    # the seller, its product count, the first page of products, their images
+    assert len(statements) == 4
+
+
+def test_sellers_batch(client, primary_engine, seed_seller, seller_id):
+    other_id = seed_seller(primary_engine, "query-counts-2@example.com", products=5, images=1)
+    with count_queries() as statements:
+        response = client.get("/sellers/batch", params={"ids": f"{seller_id},{other_id}"})
+    assert response.status_code == 200
+    assert [seller["product_count"] for seller in response.json()] == [12, 5]
+    # as many as for a single seller, the profiles share their queries
+    assert len(statements) == 4
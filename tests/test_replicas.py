@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import event
+
+import database
+
+
+class InvalidPassword(Exception):
+    # stands in for the asyncpg errors SQLAlchemy doesn't wrap at connect
+    pass
+
+
+def refuse_connections(replica: database.Replica):
+    def do_connect(*args):
+        raise InvalidPassword("password authentication failed")
+    event.listen(replica.engine.sync_engine, "do_connect", do_connect)
+    return replica
+
+
+def test_reads_are_served_by_a_replica(client, replica_engine, use_replicas, seed_seller):
+    # only the replica has this seller
+    seller_id = seed_seller(replica_engine, "replica-only@example.com")
+    use_replicas(database.Replica(str(replica_engine.url)))
+
+    response = client.get(f"/sellers/id/{seller_id}")
+    assert response.status_code == 200
+    assert response.json()["email"] == "replica-only@example.com"
+
+
+@pytest.mark.parametrize("make_replica", [
+    # an error asyncpg would raise as is: bad password, unknown role or database, ...
+    lambda: refuse_connections(database.Replica("sqlite:///replica-with-bad-password.db")),
+    # a DBAPI error, the database can't be opened
+    lambda: database.Replica("sqlite:////nonexistent/directory/replica.db"),
+])
+def test_failing_replica_falls_back_to_the_primary(client, primary_engine, use_replicas, seed_seller, make_replica):
+    seller_id = seed_seller(primary_engine, f"primary-{id(make_replica)}@example.com")
+    replica = make_replica()
+    use_replicas(replica)
+
+    response = client.get(f"/sellers/id/{seller_id}")
+    assert response.status_code == 200
+    assert not replica.healthy
+
+    # taken out of rotation: the next read goes straight to the primary
+    assert database.replicas_in_rotation() == []
@@ -0,0 +1,69 @@
+import asyncio
+
+import singleflight
+
+
+class Gate:
+    # a call that runs until the test opens the gate
+    def __init__(self):
+        self.calls = 0
+        self.opened = asyncio.Event()
+
+    async def call(self, result):
+        self.calls += 1
+        await self.opened.wait()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        group, gate = singleflight.Group(), Gate()
+        callers = [asyncio.create_task(group.do("key", gate.call, "loaded")) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.opened.set()
+        return group, gate, await asyncio.gather(*callers)
+
+    group, gate, results = asyncio.run(run())
+    assert results == ["loaded"] * 3
+    assert gate.calls == 1
+    assert group.stats() == {"in_flight": 0, "leaders": 1, "collapsed": 2}
+
+
+def test_exception_reaches_every_caller_and_releases_the_key():
+    async def run():
+        group, gate = singleflight.Group(), Gate()
+        callers = [asyncio.create_task(group.do("key", gate.call, ValueError("failed"))) for _ in range(2)]
+        await asyncio.sleep(0)
+        gate.opened.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+
+        # the next call for the key runs again
+        retried = await group.do("key", gate.call, "loaded")
+        return gate, results, retried
+
+    gate, results, retried = asyncio.run(run())
+    assert [str(result) for result in results] == ["failed", "failed"]
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == "loaded"
+    assert gate.calls == 2
+
+
+def test_cancelled_leader_doesnt_cancel_the_call():
+    async def run():
+        group, gate = singleflight.Group(), Gate()
+        leader = asyncio.create_task(group.do("key", gate.call, "loaded"))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(group.do("key", gate.call, "loaded"))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        gate.opened.set()
+        return leader, await follower, gate
+
+    leader, result, gate = asyncio.run(run())
+    assert leader.cancelled()
+    assert result == "loaded"
+    assert gate.calls == 1